@@ -35,11 +35,15 @@ __version__ = "0.7.21"
 
 # ===========================================
 
+import importlib
 import inspect
 from pathlib import Path
 
 from .my_gettext import current_lang
-from . import rich_formatters, theme, settings
+from . import dedup, settings, time_budget
+from .dedup import set_deduplication  # noqa
+from .disk_cache import set_disk_cache  # noqa
+from .time_budget import set_time_budget  # noqa
 
 from friendly_traceback import (
     about_warnings,
@@ -73,8 +77,26 @@ about_warnings.enable_warnings()
 exclude_directory_from_traceback(os.path.dirname(__file__))
 get_lang = settings.get_lang
 
+# The following submodules end up importing Rich, Pygments and IPython.
+# These are slow to import and are not needed for plain formatters, or
+# until an exception is raised; we only import them when first needed.
+_lazy_submodules = ["rich_formatters", "theme"]
 
-def install(lang=None, formatter=None, redirect=None, include="explain", _debug=None):
+
+def __getattr__(name):
+    if name in _lazy_submodules:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def install(
+    lang=None,
+    formatter=None,
+    redirect=None,
+    include="explain",
+    _debug=None,
+    asynchronous=False,
+):
     """
     Replaces ``sys.excepthook`` by friendly's own version.
     Intercepts, and can provide an explanation for all Python exceptions except
@@ -92,12 +114,19 @@ def install(lang=None, formatter=None, redirect=None, include="explain", _debug=
 
         include: controls the amount of information displayed.
         See set_include() for details.
+
+        asynchronous: if True, the output is formatted and written in
+        a separate thread. See friendly.async_output for details.
     """
     # Note: need "explain" since there is no interaction possible with install
     if lang is None:
         lang = get_lang()
     set_formatter(formatter=formatter)
     ft_install(lang=lang, redirect=redirect, include=include, _debug=_debug)
+    if asynchronous:
+        from . import async_output
+
+        async_output.enable()
 
 
 def explain_traceback(formatter=None, redirect=None):
@@ -210,6 +239,20 @@ def set_formatter(
     """Sets the default formatter. If no argument is given, a default
     formatter is used.
     """
+    # All the values changed are saved in a single write to the settings file.
+    with settings.transaction():
+        _set_formatter(
+            formatter=formatter,
+            color_system=color_system,
+            force_jupyter=force_jupyter,
+            background=background,
+        )
+
+
+def _set_formatter(formatter, color_system, force_jupyter, background):
+    """Implementation of set_formatter(), done inside a settings transaction."""
+    from . import rich_formatters, theme
+
     if formatter is not None:
         settings.write(option="formatter", value=formatter)
         if background is not None:
@@ -275,13 +318,93 @@ def set_formatter(
         formatter = rich_formatters.jupyter
         session.use_rich = False
         theme.disable_rich()
+    elif formatter == "json":
+        formatter = rich_formatters.json_lines
+        session.use_rich = False
+        theme.disable_rich()
     else:
         session.use_rich = False
         set_stream()
         theme.disable_rich()
         if formatter == "plain":
             formatter = "repl"
-    ft_set_formatter(formatter=formatter)
+    ft_set_formatter(formatter=time_budget.wrap(dedup.wrap(formatter)))
+
+
+def render(
+    info_or_exception,
+    formatter="dark",
+    include="friendly_tb",
+    width=80,
+    color_system="truecolor",
+    output="ansi",
+):
+    """Returns a string containing the explanation of an exception,
+    without writing it anywhere.
+
+    The first argument is either an exception, whose traceback is used,
+    or the information previously obtained from friendly_traceback.
+    The current console, formatter and include values are not changed,
+    so that this can be called from any thread.
+
+        formatter: "dark" or "light", for Rich-based output,
+                   or "plain", "markdown", "docs" or "json".
+
+        output: "ansi", "minimal_ansi", "html" or "text";
+                only used with Rich-based formatters.
+    """
+    from . import rich_formatters
+
+    return rich_formatters.render(
+        _get_info(info_or_exception),
+        formatter=formatter,
+        include=include,
+        width=width,
+        color_system=color_system,
+        output=output,
+    )
+
+
+def render_sections(
+    info_or_exception,
+    sections=None,
+    formatter="dark",
+    width=80,
+    color_system="truecolor",
+    output="ansi",
+):
+    """Same as render(), but returns a dict with the result for each
+    section, which is an include value such as "why" or "where".
+    By default, the sections are those shown by interactive front ends:
+    message, friendly_tb, what, why, where and detailed_tb.
+
+    This is faster than calling render() for each section since code
+    shown in more than one section is highlighted only once.
+    """
+    from . import rich_formatters
+
+    if sections is None:
+        sections = rich_formatters.SECTIONS
+    return rich_formatters.render_sections(
+        _get_info(info_or_exception),
+        sections=sections,
+        formatter=formatter,
+        width=width,
+        color_system=color_system,
+        output=output,
+    )
+
+
+def _get_info(info_or_exception):
+    """Returns the information about an exception, compiling it if needed."""
+    if not isinstance(info_or_exception, BaseException):
+        return info_or_exception
+    from friendly_traceback.core import FriendlyTraceback
+
+    exc = info_or_exception
+    friendly_tb = FriendlyTraceback(type(exc), exc, exc.__traceback__)
+    friendly_tb.compile_info()
+    return friendly_tb.info
 
 
 def start_console(  # pragma: no cover
@@ -106,7 +106,8 @@ parser.add_argument(
 parser.add_argument(
     "-f",
     "--formatter",
-    help="""Specifies an output format (bw, dark, light, docs, markdown, or markdown_docs)
+    help="""Specifies an output format (bw, dark, light, docs, markdown, markdown_docs,
+    or json)
     or a custom formatter function, as a dotted path. By default, the console
     will use dark if it is available.
 
@@ -176,7 +177,7 @@ def main():
 
     if args.formatter:
         formatter = args.formatter  # noqa
-        if formatter in ["repl", "dark", "light", "docs"]:
+        if formatter in ["repl", "dark", "light", "docs", "json"]:
             set_formatter(formatter, background=args.background)  # pragma: no cover
         else:
             set_formatter(import_function(args.formatter))
@@ -0,0 +1,205 @@
+"""Formatting and writing the output of the exception hook in a separate thread.
+
+When friendly is installed as the exception hook, with a Rich formatter,
+the thread in which an exception is raised normally waits while the
+Markdown text is parsed, the code highlighted and the result written.
+For services where this delay matters, enable() can be used so that
+this thread only collects the information about the exception; this
+information is then formatted and written by a dedicated thread.
+
+The information waiting to be written is kept in a bounded queue.
+When the queue is full, the policy given by ``overflow`` is used:
+
+* "drop_newest": the information about the new exception is discarded;
+* "drop_oldest": the oldest information in the queue is discarded;
+* "block": the thread in which the exception was raised waits.
+
+All the information in the queue is written when the interpreter exits.
+The number of exceptions discarded is available from get_dropped(); it
+is also written to sys.stderr when the queue is flushed, if exceptions
+have been discarded since this was last done.
+"""
+import atexit
+import queue
+import sys
+import threading
+import traceback
+import types
+from typing import Optional
+
+from friendly_traceback.config import session
+
+from . import dedup
+
+OVERFLOW_POLICIES = ["drop_newest", "drop_oldest", "block"]
+
+_writer = None  # not a constant
+
+
+class AsyncWriter:
+    """Thread formatting and writing the information about exceptions."""
+
+    def __init__(
+        self, maxsize: int = 100, overflow: str = "drop_newest", timeout: float = 5
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.overflow = overflow
+        self.timeout = timeout  # Maximum time waited by flush() at exit
+        self.dropped = 0  # Number of exceptions discarded
+        self._reported = 0  # Value of dropped last written to sys.stderr
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="friendly-async-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, info, formatter, include: str, write_err) -> None:
+        """Adds the information about an exception to the queue.
+
+        A copy of info is made, as a read-only mapping, so that it
+        cannot be modified before it is formatted. It records the id of
+        info, so that the Deduplicator recognizes it if info is shown again.
+        """
+        copy = dict(info)
+        copy.setdefault(dedup.INFO_ID, id(info))
+        item = (types.MappingProxyType(copy), formatter, include, write_err)
+        if self.overflow == "block":
+            self._queue.put(item)
+            return
+        # The lock ensures that a slot freed by drop_oldest is not
+        # taken by another thread before the new item is added.
+        with self._lock:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    self.dropped += 1
+                    if self.overflow == "drop_newest":
+                        return
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                except queue.Empty:  # pragma: no cover
+                    self.dropped -= 1  # emptied by the writer in the meantime
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until everything in the queue has been written, or until
+        timeout seconds have passed. Returns True if the queue is empty."""
+        with self._queue.all_tasks_done:
+            empty = self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks, timeout
+            )
+        self.report_dropped()
+        return empty
+
+    def report_dropped(self) -> None:
+        """Writes to sys.stderr the number of exceptions discarded since
+        this was last done, if any."""
+        with self._lock:
+            dropped = self.dropped - self._reported
+            self._reported = self.dropped
+        if dropped > 0:
+            print(
+                f"friendly: the explanation of {dropped} exception(s) was "
+                "discarded because the output queue was full.",
+                file=sys.stderr,
+            )
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Writes everything in the queue, and stops the thread."""
+        self.flush(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            try:
+                self._write(*item)
+            except Exception:  # pragma: no cover
+                print("Exception raised by friendly's async writer.", file=sys.stderr)
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _write(info, formatter, include, write_err) -> None:
+        """Same as friendly_traceback's session.output_info()."""
+        explanation = formatter(info, include=include)
+        write_err(explanation)
+        # Ensures that we start on a new line; essential for the console
+        if hasattr(explanation, "endswith") and not explanation.endswith("\n"):
+            write_err("\n")
+
+
+def exception_hook(etype, value, tb) -> None:
+    """Replaces session.exception_hook when the output is asynchronous."""
+    if _writer is None or etype.__name__ in ["SystemExit", "KeyboardInterrupt"]:
+        session.exception_hook(etype, value, tb)
+        return
+    info = session.get_traceback_info(etype, value, tb)
+    if not info:
+        return
+    _writer.submit(info, session.formatter, session.include, session.write_err)
+
+
+def enable(maxsize: int = 100, overflow: str = "drop_newest", timeout: float = 5):
+    """Formats and writes the output of the exception hook in a separate
+    thread, with at most maxsize exceptions waiting to be written.
+    See the module docstring for the overflow policies. At exit, we wait
+    at most timeout seconds for the output to be written.
+
+    This only applies to exceptions handled by the exception hook set
+    by friendly.install(), which must be called first; alternatively,
+    use friendly.install(asynchronous=True).
+    """
+    global _writer
+    if _writer is not None:
+        disable()
+    _writer = AsyncWriter(maxsize=maxsize, overflow=overflow, timeout=timeout)
+    if session.installed:
+        sys.excepthook = exception_hook
+
+
+def disable() -> None:
+    """Writes everything still in the queue, and goes back to formatting
+    and writing the output in the thread where the exception was raised."""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop(writer.timeout)
+    if sys.excepthook is exception_hook:
+        sys.excepthook = session.exception_hook
+
+
+def get_writer():
+    """Returns the AsyncWriter in use, or None."""
+    return _writer
+
+
+def get_dropped() -> int:
+    """Returns the number of exceptions whose explanation was discarded
+    because the queue was full."""
+    if _writer is None:
+        return 0
+    return _writer.dropped
+
+
+def flush(timeout: Optional[float] = None) -> bool:
+    """Waits until the output of all the exceptions has been written.
+    Returns False if this did not happen before timeout seconds."""
+    if _writer is None:
+        return True
+    return _writer.flush(timeout)
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+    if _writer is not None:
+        _writer.flush(_writer.timeout)
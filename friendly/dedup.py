@@ -0,0 +1,160 @@
+"""Deduplication and rate limiting of the output for repeated exceptions.
+
+A loop which raises and catches the same error, or a notebook cell run
+many times, would otherwise show a full explanation every time.
+When enabled with set_deduplication(), the formatter set by
+set_formatter() is wrapped by a Deduplicator:
+
+* an exception is identified by its fingerprint: its name, the template
+  of its message and the location where it was raised;
+* only the first occurrence of an exception within ``window`` seconds
+  is shown in full; the others are replaced by a one-line summary
+  stating how many times it has been seen;
+* full explanations are also limited by a token bucket, holding at most
+  ``burst`` tokens and refilled at ``rate`` tokens per second; when it
+  is empty, new exceptions are shown as a one-line summary.
+"""
+import collections
+import html
+import json
+import threading
+import time
+
+from friendly_traceback import base_formatters
+from friendly_traceback.config import session
+
+from . import time_budget
+from .my_gettext import current_lang
+
+MAX_FINGERPRINTS = 1000
+# Key added by async_output to its copy of the information about an
+# exception, so that it can be recognized when shown again with why().
+INFO_ID = "_friendly_info_id"
+
+_options = None  # not a constant; keyword arguments of Deduplicator
+
+
+def info_id(info) -> int:
+    """Identifies the information about an exception; unlike id(info),
+    this is preserved by the copy made by async_output."""
+    return info.get(INFO_ID, id(info))
+
+
+class _Seen:
+    __slots__ = ["start", "count", "info", "info_id"]
+
+    def __init__(self, start, info):
+        self.start = start  # Beginning of the window
+        self.count = 1
+        self.info = info  # Last information shown; kept so that its id is unique
+        self.info_id = info_id(info)
+
+
+class Deduplicator:
+    """Formatter wrapping another one; see the module docstring."""
+
+    def __init__(self, formatter, window=60.0, rate=1.0, burst=10, clock=None):
+        self.formatter = formatter
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock or time.monotonic
+        self.tokens = burst
+        self._last_refill = self.clock()
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, info, include="explain"):
+        from .rich_formatters import fingerprint
+
+        key = fingerprint(info)
+        with self._lock:
+            now = self.clock()
+            seen = self._seen.get(key)
+            if seen is not None and seen.info_id == info_id(info):
+                # Shown again, for example by why(); this is not a repeat.
+                return self.formatter(info, include=include)
+            if seen is not None and now - seen.start < self.window:
+                seen.count += 1
+                seen.info = info
+                seen.info_id = info_id(info)
+                self._seen.move_to_end(key)
+                return self.summary(info, key, seen.count)
+            self._seen[key] = _Seen(now, info)
+            self._seen.move_to_end(key)
+            if len(self._seen) > MAX_FINGERPRINTS:
+                self._seen.popitem(last=False)
+            if not self._take_token(now):
+                return self.summary(info, key, 1)
+        return self.formatter(info, include=include)
+
+    def _take_token(self, now) -> bool:
+        self.tokens = min(
+            self.burst, self.tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def summary(self, info, key, count) -> str:
+        """One line shown instead of the full explanation."""
+        from . import rich_formatters
+
+        message = info.get("message", "").strip()
+        if self.formatter is rich_formatters.json_lines:
+            record = {
+                "exception": rich_formatters.exception_name(info),
+                "message": message,
+                "fingerprint": key,
+                "count": count,
+                "summary": True,
+            }
+            return json.dumps(record, separators=(",", ":")) + "\n"
+        _ = current_lang.translate
+        if count == 1:
+            text = _("{message} (explanation skipped: too many exceptions)")
+        else:
+            text = _("{message} (seen {count} times)")
+        text = text.format(message=message, count=count)
+        if rich_formatters.ipython_available and self.formatter in (
+            rich_formatters.jupyter,
+            rich_formatters.jupyter_interactive,
+        ):
+            # These formatters display their output themselves.
+            rich_formatters.display_html(f"<pre>{html.escape(text)}</pre>")
+            if self.formatter is rich_formatters.jupyter:
+                return ""
+            return None
+        return text + "\n"
+
+
+def wrap(formatter):
+    """Returns the formatter, wrapped by a Deduplicator if enabled."""
+    if isinstance(formatter, time_budget.TimeBudget):
+        # The time budget must include the time used by the Deduplicator.
+        return time_budget.wrap(wrap(formatter.formatter))
+    if isinstance(formatter, Deduplicator):
+        formatter = formatter.formatter
+    if _options is None:
+        return formatter
+    if formatter is None or formatter == "repl":
+        formatter = base_formatters.repl
+    elif formatter == "docs":
+        formatter = base_formatters.docs
+    elif isinstance(formatter, str):
+        return formatter  # Unknown; reported by friendly_traceback
+    return Deduplicator(formatter, **_options)
+
+
+def set_deduplication(enabled=True, window=60.0, rate=1.0, burst=10):
+    """Enables, or disables, the deduplication and rate limiting of
+    the output of repeated exceptions for the current formatter,
+    and those set afterwards. See the module docstring for details."""
+    global _options
+    if enabled:
+        _options = {"window": window, "rate": rate, "burst": burst}
+    else:
+        _options = None
+    session.set_formatter(wrap(session.formatter))
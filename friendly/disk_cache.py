@@ -0,0 +1,247 @@
+"""Persistent cache of rendered explanations, shared by all processes.
+
+The same failures are often explained many times, for example when
+the same programs are run repeatedly by a CI service. The rendered
+output only depends on the Markdown text produced by the formatter,
+which itself depends on the information about the exception, the
+include value and the language, and on the rendering options such as
+the width and the theme. It can thus be saved on disk, compressed,
+in a file whose name is a hash of all these values.
+
+This is done for the output written to a terminal by the Rich-based
+formatters, for the HTML of the interactive Jupyter formatters (unless
+use_css_classes() is used) and for the code highlighted by jupyter().
+Hashing the Markdown text rather than the information itself means that
+a file is reused only if the output would be the same.
+
+The cache is disabled by default. It can be enabled with set_disk_cache(),
+or by setting the environment variable FRIENDLY_CACHE_DIR to the
+directory to use, or to "default" for the default directory.
+The total size of the files is kept below ``max_size`` bytes by
+removing those which have been used least recently.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import warnings
+import zlib
+from typing import List, Optional, Tuple
+
+import platformdirs
+
+MAX_SIZE = 50 * 2**20  # bytes
+# Changing this invalidates all the files previously saved.
+FORMAT_VERSION = 1
+
+_cache = None  # not a constant
+
+
+class DiskCache:
+    """Directory of zlib-compressed text files, named after the
+    hash of the values from which the text was obtained.
+
+    The directory is only created when the first file is saved. The last
+    time a file was used is its modification time; it is only updated when
+    it is more than ``TOUCH_INTERVAL`` seconds old, so that reading a file
+    rarely writes anything. The total size of the files is kept up to date
+    as they are saved, and the directory is only scanned when it exceeds
+    max_size, to remove the least recently used files.
+    """
+
+    TOUCH_INTERVAL = 3600  # seconds
+
+    def __init__(
+        self, directory: Optional[str] = None, max_size: int = MAX_SIZE
+    ) -> None:
+        if directory is None:
+            directory = os.path.join(
+                platformdirs.user_cache_dir(
+                    appname="FriendlyTraceback", appauthor=False  # noqa
+                ),
+                "renders",
+            )
+        self.directory = directory
+        self.max_size = max_size
+        self._size = 0  # total size of the files, once the directory is scanned
+        self._scanned = False
+        self._lock = threading.Lock()
+
+    def key(self, *values: object) -> str:
+        """Returns a hash of values, and of the versions of the
+        packages used to render them."""
+        data = json.dumps([_versions(), *values], default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".z")
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the text saved for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime
+            text = zlib.decompress(data).decode("utf-8")
+            if time.time() - mtime > self.TOUCH_INTERVAL:
+                os.utime(path)  # Most recently used
+        except (OSError, zlib.error, UnicodeDecodeError):
+            return None
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        """Saves text for key, and removes the least recently used files
+        if the cache has become too large.
+
+        If the file cannot be written, the cache is disabled."""
+        data = zlib.compress(text.encode("utf-8"))
+        if len(data) > self.max_size:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._lock:
+                if not self._scanned:
+                    self._size = self._scan()[1]
+                    self._scanned = True
+            try:
+                old_size = os.stat(path).st_size
+            except FileNotFoundError:
+                old_size = 0
+            # Written to a temporary file first so that other processes
+            # never read a partially written file.
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError:
+                with contextlib.suppress(OSError):
+                    os.remove(temp_path)
+                raise
+        except OSError as e:
+            _disable_after_error(self, e)
+            return
+        with self._lock:
+            self._size += len(data) - old_size
+            too_large = self._size > self.max_size
+        if too_large:
+            self.evict()
+
+    def _scan(self) -> Tuple[List[Tuple[float, int, str]], int]:
+        """Returns a list of (mtime, size, path) for all the saved files,
+        and their total size."""
+        files = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".z"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except FileNotFoundError:
+            pass
+        return files, total
+
+    def evict(self) -> None:
+        """Removes the least recently used files until the total size
+        is below max_size."""
+        with self._lock:
+            # Other processes may have saved or removed files.
+            files, total = self._scan()
+            if total > self.max_size:
+                files.sort()
+                for _mtime, size, path in files:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    if total <= self.max_size:
+                        break
+            self._size = total
+            self._scanned = True
+
+    def clear(self) -> None:
+        """Removes all the saved files."""
+        with self._lock:
+            for _mtime, _size, path in self._scan()[0]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+            self._scanned = True
+
+
+def _disable_after_error(cache: DiskCache, error: OSError) -> None:
+    warnings.warn(
+        f"Disabling friendly's disk cache in {cache.directory}: {error}",
+        RuntimeWarning,
+    )
+    if _cache is cache:
+        disable()
+
+
+_package_versions: Optional[List[object]] = None  # not a constant
+
+
+def _versions() -> List[object]:
+    global _package_versions
+    if _package_versions is None:
+        from importlib import metadata
+
+        versions: List[object] = [FORMAT_VERSION]
+        for package in ["friendly", "friendly_traceback", "rich", "pygments"]:
+            try:
+                versions.append(metadata.version(package))
+            except metadata.PackageNotFoundError:
+                versions.append(None)
+        _package_versions = versions
+    return _package_versions
+
+
+def enable(directory: Optional[str] = None, max_size: int = MAX_SIZE) -> DiskCache:
+    """Saves rendered explanations in directory, or in the default cache
+    directory of friendly, using at most max_size bytes."""
+    global _cache
+    _cache = DiskCache(directory, max_size=max_size)
+    return _cache
+
+
+def disable() -> None:
+    global _cache
+    _cache = None
+
+
+def set_disk_cache(
+    enabled: bool = True, directory: Optional[str] = None, max_size: int = MAX_SIZE
+) -> None:
+    """Enables, or disables, the persistent cache of rendered explanations.
+    See friendly.disk_cache for details."""
+    if enabled:
+        enable(directory, max_size=max_size)
+    else:
+        disable()
+
+
+def get_cache() -> Optional[DiskCache]:
+    """Returns the DiskCache in use, or None."""
+    return _cache
+
+
+if os.environ.get("FRIENDLY_CACHE_DIR"):
+    enable(
+        directory=None
+        if os.environ["FRIENDLY_CACHE_DIR"] == "default"
+        else os.environ["FRIENDLY_CACHE_DIR"]
+    )
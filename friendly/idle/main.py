@@ -19,7 +19,7 @@ from friendly_traceback.functions_help import add_help_attribute
 from friendly import get_lang
 from friendly import settings
 from ..my_gettext import current_lang
-from .. import idle_writer
+from .. import idle_writer, time_budget
 from . import patch_source_cache  # noqa
 from .get_syntax import get_syntax_error
 
@@ -117,7 +117,7 @@ def install(lang=get_lang()):
     _ = current_lang.translate
 
     sys.stderr = sys.stdout.shell  # noqa
-    friendly_traceback.set_formatter(idle_writer.formatter)
+    friendly_traceback.set_formatter(time_budget.wrap(idle_writer.formatter))
     if sys.version_info >= (3, 9, 5) or (
         sys.version_info >= (3, 8, 10) and sys.version_info < (3, 9, 0)
     ):
@@ -134,7 +134,7 @@ def start_console(lang="en", displayhook=None, ipython_prompt=True):
     sys.stderr = sys.stdout.shell  # noqa
     friendly_traceback.set_stream(_writer)
     friendly_traceback.start_console(
-        formatter=idle_writer.formatter,
+        formatter=time_budget.wrap(idle_writer.formatter),
         lang=lang,
         displayhook=displayhook,
         ipython_prompt=ipython_prompt,
@@ -182,7 +182,7 @@ def run(
     _ = current_lang.translate
 
     sys.stderr = sys.stdout.shell  # noqa
-    friendly_traceback.set_formatter(idle_writer.formatter)
+    friendly_traceback.set_formatter(time_budget.wrap(idle_writer.formatter))
     friendly_traceback.set_stream(_writer)
 
     filename = Path(filename)
@@ -211,6 +211,6 @@ def run(
         include=include,
         args=args,
         console=console,
-        formatter=idle_writer.formatter,
+        formatter=time_budget.wrap(idle_writer.formatter),
         ipython_prompt=ipython_prompt,
     )
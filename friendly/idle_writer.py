@@ -10,6 +10,8 @@ import sys
 from friendly_traceback.base_formatters import select_items, no_result, repl_indentation
 from friendly_traceback.utils import get_highlighting_ranges
 
+from . import time_budget
+
 if sys.version_info >= (3, 9, 5):
     repl_indentation["suggest"] = "single"  # more appropriate value
 
@@ -143,6 +145,7 @@ def formatter(info, include="friendly_tb"):
     spacing = {"single": " " * 4, "double": " " * 8, "none": ""}
     result = ["\n"]
     for item in items_to_show:
+        time_budget.check("idle")
         if item == "header":
             continue
 
@@ -7,6 +7,11 @@ def init_settings(default_formatter="dark"):
     """Initialises the formatter using saved settings for the
     current environment.
     """
+    with settings.transaction():
+        _init_settings(default_formatter)
+
+
+def _init_settings(default_formatter):
     if settings.has_environment(settings.ENVIRONMENT):
         formatter = settings.read(option="formatter")
         background = settings.read(option="background")
@@ -5,6 +5,7 @@ from friendly.ipython_common import excepthook
 from friendly.ipython_common.settings import init_settings
 
 from friendly import print_repl_header
+from friendly.rich_formatters import use_css_classes, use_shared_script
 from friendly import settings
 from friendly_traceback import config
 from friendly.rich_console_helpers import *  # noqa
@@ -81,6 +82,20 @@ add_help_attribute({"set_tb_width": set_tb_width})
 Friendly.add_helper(set_tb_width)
 helpers["set_tb_width"] = set_tb_width
 
+short_description["use_shared_script"] = lambda: _(
+    "Sends the script used by interactive tracebacks only once."
+)
+add_help_attribute({"use_shared_script": use_shared_script})
+Friendly.add_helper(use_shared_script)
+helpers["use_shared_script"] = use_shared_script
+
+short_description["use_css_classes"] = lambda: _(
+    "Uses CSS classes instead of inline styles for interactive tracebacks."
+)
+add_help_attribute({"use_css_classes": use_css_classes})
+Friendly.add_helper(use_css_classes)
+helpers["use_css_classes"] = use_css_classes
+
 __all__ = list(helpers.keys())
 
 excepthook.enable()
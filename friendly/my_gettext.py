@@ -20,16 +20,32 @@ where current_lang.translate means gettext.translation().gettext where
 gettext.translation() is the class-based API for gettext.
 """
 
+import collections
 import gettext
 import os
+import threading
 
 from . import settings
 from friendly_traceback import debug_helper
 
+LOCALEDIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "locales"))
+CACHE_SIZE = 8  # number of languages whose translations are kept in memory
+
 
 class LangState:
+    """Keeps track of the language used for translations.
+
+    Finding and parsing the catalog of translations is only done when
+    a translation is first needed, and the result is cached so that
+    switching back and forth between languages does not require
+    searching the file system again.
+    """
+
     def __init__(self):
         self._translate = lambda text: text
+        self._requested = None  # language installed, but catalog not yet loaded
+        self._catalogs = collections.OrderedDict()
+        self._lock = threading.Lock()
         self.lang = self.get_lang()
 
     def get_lang(self):
@@ -40,13 +56,19 @@ class LangState:
         """Sets the language to be used for translations"""
         if lang is None:
             lang = self.get_lang()
+        with self._lock:
+            self._requested = lang
+            # The language actually used, which can be more generic, is
+            # only known once its catalog has been loaded.
+            self.lang = lang
+
+    def _load_catalog(self, lang):
+        """Returns the language actually used and its translation function."""
         try:
             # We first look for the exact language requested.
             _lang = gettext.translation(
                 "friendly_" + lang,
-                localedir=os.path.normpath(
-                    os.path.join(os.path.dirname(__file__), "locales")
-                ),
+                localedir=LOCALEDIR,
                 languages=[lang],
                 fallback=False,
             )
@@ -57,18 +79,32 @@ class LangState:
             lang = lang[:2]
             _lang = gettext.translation(
                 "friendly_" + lang,
-                localedir=os.path.normpath(
-                    os.path.join(os.path.dirname(__file__), "locales")
-                ),
+                localedir=LOCALEDIR,
                 languages=[lang],
                 fallback=True,  # This means that the hard-coded strings in
                 # the source file will be used if the requested language
                 # is not available.
             )
-        self.lang = lang
-        self._translate = _lang.gettext
+        return lang, _lang.gettext
+
+    def _activate(self):
+        """Makes the language last installed the one used for translations."""
+        with self._lock:
+            requested = self._requested
+            if requested is None:  # Activated by another thread
+                return
+            if requested in self._catalogs:
+                self._catalogs.move_to_end(requested)
+            else:
+                self._catalogs[requested] = self._load_catalog(requested)
+                if len(self._catalogs) > CACHE_SIZE:
+                    self._catalogs.popitem(last=False)
+            self.lang, self._translate = self._catalogs[requested]
+            self._requested = None
 
     def translate(self, text):
+        if self._requested is not None:
+            self._activate()
         translation = self._translate(text)
         if translation == text and self.lang == "fr":  # pragma: no cover
             debug_helper.log(f"Potentially untranslated text for {self.lang}:")
@@ -9,6 +9,7 @@ from friendly_traceback.config import session
 from friendly.my_gettext import current_lang
 from friendly import _print_settings
 from friendly.settings import _remove_environment
+from friendly.rich_formatters import use_minimal_ansi
 from friendly.theme import colours
 
 # The following is different from the one imported via the import * above
@@ -113,6 +114,9 @@ short_description["plain"] = lambda: _("Plain formatting, with no colours added.
 short_description["set_background"] = lambda: _("Sets the background color.")
 short_description["set_highlight"] = lambda: _("Sets the highlight colors; bg and fg.")
 short_description["set_width"] = lambda: _("Sets the output width in some modes.")
+short_description["use_minimal_ansi"] = lambda: _(
+    "Writes fewer colour codes; useful for log files and slow connections."
+)
 short_description["_print_settings"] = lambda: _("Prints the saved settings.")
 short_description["_remove_environment"] = lambda: (
     "Deletes an environment from the saved settings; default: current environment."
@@ -126,6 +130,7 @@ local_helpers = {
     "set_width": set_width,
     "set_background": set_background,
     "set_highlight": set_highlight,
+    "use_minimal_ansi": use_minimal_ansi,
     "_print_settings": _print_settings,
     "_remove_environment": _remove_environment,
 }
@@ -16,38 +16,83 @@ This module currently contains the following formatters
     but where each header is shifted down by 2 (h1 -> h3, etc.) so that they
     can be inserted in a document, without creating artificial top headers.
 
+* ``json_lines()``: This produces a single line containing a JSON object,
+    for log files and log aggregation tools.
+
 * ``rich_markdown()``: This produces an output formatted with Markdown syntax,
     with some modification, with the end result intended to be printed
     in colour in a console using Rich (https://github.com/willmcgugan/rich).
 """
+import contextvars
+import functools
+import hashlib
+import html
+import importlib.util
+import io
+import itertools
+import json
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from . import disk_cache, time_budget
 from .my_gettext import current_lang
-from friendly_traceback.base_formatters import no_result, repl, select_items
+from friendly_traceback.base_formatters import docs, no_result, repl, select_items
 from friendly_traceback.config import session
 from friendly_traceback.typing_info import InclusionChoice, Info
-from friendly.theme import friendly_pygments
 
-from pygments import highlight  # noqa
-from pygments.lexers import PythonLexer, PythonTracebackLexer  # noqa
-from pygments.formatters import HtmlFormatter  # noqa
+# Rich, Pygments and IPython are slow to import. They are only imported
+# when a formatter that requires them is used for the first time.
+ipython_available = importlib.util.find_spec("IPython") is not None
 
-from rich import jupyter as rich_jupyter
-from rich.markdown import Markdown
-from rich.panel import Panel
+SHARED_SCRIPT = False  # not a constant
+_shared_script_sent = False
+CSS_CLASSES = False  # not a constant
+_css_classes = {}  # HTML style rule -> class name
+_new_css_rules = []  # rules not yet sent to the notebook
+_jupyter_css_sent = False
+MINIMAL_ANSI = False  # not a constant
+MINIMAL_ANSI_BACKGROUND = None  # not a constant
 
-ipython_available = False
-try:  # pragma: no cover
+_ = current_lang.translate
 
-    from IPython.display import display, HTML  # noqa
 
-    ipython_available = True
-except ImportError:
-    display = HTML = lambda x: x
+class RenderState(NamedTuple):
+    """Information passed by _rich_markdown() to the writer about how
+    the Markdown text it returns must be rendered."""
 
-RICH_HEADER = False  # not a constant
-WIDE_OUTPUT = False  # not a constant
-COUNT = 0  # not a constant
+    header: bool = False  # Show it inside a panel with a "Traceback" title
+    width: Optional[int] = None  # Replaces the console width if not None
+    plain: bool = False  # Not Markdown; written as is
+    # Set by a TimeBudget; rendering is then part of its budget.
+    budget: Optional[time_budget.FormattingBudget] = None
 
-_ = current_lang.translate
+
+# The formatter and the writer are called one after the other in the same
+# thread, or asyncio task; a context variable, rather than a global,
+# ensures that exceptions formatted concurrently do not share this state.
+_render_state = contextvars.ContextVar("friendly_render_state", default=RenderState())
+# Used to give a unique id to the HTML elements of each interactive traceback.
+_html_ids = itertools.count(1)
+
+
+def _take_render_state() -> RenderState:
+    """Returns the current render state, and resets it."""
+    state = _render_state.get()
+    _render_state.set(RenderState())
+    return state
+
+
+def display_html(content: str) -> None:  # pragma: no cover
+    """Displays HTML content in a Jupyter notebook."""
+    if not ipython_available:
+        return
+    from IPython.display import display, HTML  # noqa
+
+    display(HTML(content))
 
 
 def jupyter_interactive(
@@ -55,63 +100,251 @@ def jupyter_interactive(
 ) -> None:  # noqa
     """This implements a formatter that inserts buttons in a jupyter notebook
     allowing to selectively show what/why/where, instead of
-    showing the friendly_tb by default."""
-    global COUNT
+    showing the friendly_tb by default.
+
+    All the content is sent to the notebook as a single HTML document.
+    """
     if include != "friendly_tb":
-        text = _markdown(info, include=include, rich=True)
+        text = _rich_markdown(info, include)
         rich_writer(text)
         return
-    COUNT += 1
     session.rich_add_vspace = False
-    add_message(info, count=COUNT)
+    display_html(interactive_html(info, count=next(_html_ids)))
+
+
+def interactive_html(info: Info, count: int = -1) -> str:
+    """HTML for the message and the buttons used to show the other items."""
+    from .theme import friendly_rich
+
     if "detailed_tb" in info:
         add_detailed_tb = len(info["detailed_tb"]) > 2
     else:
         add_detailed_tb = False
-    add_control(count=COUNT, add_detailed_tb=add_detailed_tb)
-    add_friendly_tb(info, count=COUNT)
-    add_interactive_item(info, "what", count=COUNT)
-    add_interactive_item(info, "why", count=COUNT)
-    add_interactive_item(info, "where", count=COUNT)
+    # The same code blocks are often shown by friendly_tb, where, etc.
+    with friendly_rich.shared_code_blocks():
+        if SHARED_SCRIPT:
+            content = shared_interactive_html(info, add_detailed_tb=add_detailed_tb)
+        else:
+            content = _interactive_html(info, count, add_detailed_tb)
+    return _take_stylesheet() + content
+
+
+def _interactive_html(info: Info, count: int, add_detailed_tb: bool) -> str:
+    """HTML for each item, with its own script for the buttons."""
+    parts = [
+        message_html(info, count=count),
+        control_html(count=count, add_detailed_tb=add_detailed_tb),
+        friendly_tb_html(info, count=count),
+        interactive_item_html(info, "what", count=count),
+        interactive_item_html(info, "why", count=count),
+        interactive_item_html(info, "where", count=count),
+    ]
     if add_detailed_tb:
-        add_interactive_item(info, "detailed_tb", count=COUNT)
+        parts.append(interactive_item_html(info, "detailed_tb", count=count))
+    return "".join(parts)
 
 
-def add_message(info: Info, count: int = -1) -> None:
-    """Shows the error message. By default, this is the only item shown
-    other than a button to reveal"""
-    old_jupyter_html_format = rich_jupyter.JUPYTER_HTML_FORMAT
-    rich_jupyter.JUPYTER_HTML_FORMAT = (
-        "<div id='friendly-message{count}'>".format(count=count)
-        + old_jupyter_html_format
-        + "</div>"
-    )
-    text = _markdown(info, include="message", rich=True)
-    rich_writer(text)
-    rich_jupyter.JUPYTER_HTML_FORMAT = old_jupyter_html_format
+def use_shared_script(shared: bool = True) -> None:
+    """When shared is True, the script and style sheet used by
+    jupyter_interactive are sent to the notebook only once, together with
+    the first traceback shown; each traceback then only contains HTML
+    elements with data- attributes, which greatly reduces the size
+    of notebooks with many tracebacks.
 
+    However, if the output containing the script is cleared, the buttons
+    of the other tracebacks shown in the same session no longer work.
+    """
+    global SHARED_SCRIPT
+    SHARED_SCRIPT = shared
 
-def add_friendly_tb(info: Info, count: int = -1) -> None:
-    """Adds the friendly_tb, hidden by default"""
-    old_jupyter_html_format = rich_jupyter.JUPYTER_HTML_FORMAT
-    name = "friendly_tb"
-    rich_jupyter.JUPYTER_HTML_FORMAT = (
-        "<div id='friendly-tb-{name}-content{count}' style='display:none'>".format(
-            name=name, count=count
+
+# Sent once per session when SHARED_SCRIPT is True.
+SHARED_SCRIPT_HTML = """<style>
+[data-friendly-expanded="true"] > [data-friendly-part="message"],
+[data-friendly-expanded="false"] > [data-friendly-part="friendly_tb"],
+[data-friendly-expanded="false"] > [data-friendly-part="button"],
+[data-friendly-part="content"]:not([data-friendly-shown="true"]) {
+    display: none;
+}
+</style>
+<script type="text/Javascript">
+function friendlyToggleMore(btn) {
+    var widget = btn.parentElement;
+    var expand = widget.dataset.friendlyExpanded !== "true";
+    widget.dataset.friendlyExpanded = expand ? "true" : "false";
+    btn.textContent = expand ? widget.dataset.friendlyLess : widget.dataset.friendlyMore;
+    if (!expand) {
+        widget.querySelectorAll("[data-friendly-item]").forEach(function (el) {
+            if (el.dataset.friendlyPart === "content") {
+                el.dataset.friendlyShown = "false";
+            } else {
+                el.textContent = el.dataset.friendlyItem + "()";
+            }
+        });
+    }
+}
+function friendlyToggleItem(btn) {
+    var widget = btn.parentElement;
+    var name = btn.dataset.friendlyItem;
+    var content = widget.querySelector(
+        '[data-friendly-part="content"][data-friendly-item="' + name + '"]'
+    );
+    var show = content.dataset.friendlyShown !== "true";
+    content.dataset.friendlyShown = show ? "true" : "false";
+    btn.textContent = show ? widget.dataset.friendlyHide + " " + name + "()" : name + "()";
+}
+</script>
+"""
+
+
+def shared_interactive_html(info: Info, add_detailed_tb: bool = False) -> str:
+    """HTML for the interactive traceback, relying on SHARED_SCRIPT_HTML."""
+    global _shared_script_sent
+    btn_style = session.jupyter_button_style
+    parts = []
+    if not _shared_script_sent:
+        parts.append(SHARED_SCRIPT_HTML)
+        _shared_script_sent = True
+    parts.append(
+        "<div data-friendly-expanded='false' data-friendly-more='{more}' "
+        "data-friendly-less='{less}' data-friendly-hide='{hide}'>".format(
+            more=html.escape(_("More ...")),
+            less=html.escape(_("Show message only")),
+            hide=html.escape(_("Hide")),
+        )
+    )
+    parts.append(_rich_html(info, "message", "<div data-friendly-part='message'>"))
+    parts.append(
+        "<button data-friendly-part='control' onclick='friendlyToggleMore(this)' "
+        "style='{btn_style}'>{more}</button>".format(
+            btn_style=btn_style, more=_("More ...")
         )
-        + old_jupyter_html_format
-        + "</div>"
     )
-    text = _markdown(info, include="friendly_tb", rich=True)
-    rich_writer(text)
-    rich_jupyter.JUPYTER_HTML_FORMAT = old_jupyter_html_format
+    parts.append(
+        _rich_html(info, "friendly_tb", "<div data-friendly-part='friendly_tb'>")
+    )
+    names = ["what", "why", "where"]
+    if add_detailed_tb:
+        names.append("detailed_tb")
+    for name in names:
+        parts.append(
+            "<button data-friendly-part='button' data-friendly-item='{name}' "
+            "onclick='friendlyToggleItem(this)' style='{btn_style}'>"
+            "{name}()</button>".format(name=name, btn_style=btn_style)
+        )
+        div = "<div data-friendly-part='content' data-friendly-item='{name}'>".format(
+            name=name
+        )
+        parts.append(_rich_html(info, name, div))
+    parts.append("</div>")
+    return "".join(parts)
 
 
-def add_interactive_item(info: Info, name: InclusionChoice, count: int = -1) -> None:
-    """Adds interactive items (what/why/where) with buttons to toggle
-    their visibility."""
-    old_jupyter_html_format = rich_jupyter.JUPYTER_HTML_FORMAT
+def use_css_classes(css_classes: bool = True) -> None:
+    """When css_classes is True, the HTML produced by Rich for the
+    interactive formatters uses CSS classes instead of inline styles.
+    The style sheet defining a class is sent to the notebook only once,
+    the first time a class is used; this makes the HTML of each traceback
+    several times smaller.
+
+    As with use_shared_script(), clearing the output containing a style sheet
+    affects the display of the other tracebacks shown in the same session.
+    """
+    global CSS_CLASSES
+    CSS_CLASSES = css_classes
+
 
+def _css_class(rule: str) -> str:
+    """Returns the name of the CSS class for an HTML style rule.
+
+    The name is derived from the rule so that it is the same in every
+    session; a style sheet saved in a notebook remains valid.
+    """
+    if rule not in _css_classes:
+        name = "friendly-{:08x}".format(zlib.crc32(rule.encode("utf-8")))
+        _css_classes[rule] = name
+        _new_css_rules.append(f".{name} {{{rule}}}")
+    return _css_classes[rule]
+
+
+def _take_stylesheet() -> str:
+    """Returns a style sheet with the CSS classes not yet sent, if any."""
+    if not _new_css_rules:
+        return ""
+    rules = "\n".join(_new_css_rules)
+    _new_css_rules.clear()
+    return f"<style>\n{rules}\n</style>\n"
+
+
+def _render_segments_html(segments: list, css_classes: bool = False) -> str:
+    """Returns the HTML displayed by Rich in Jupyter for segments, using
+    CSS classes instead of inline styles if css_classes is True."""
+    from rich import jupyter as rich_jupyter
+    from rich.segment import Segment
+    from rich.terminal_theme import DEFAULT_TERMINAL_THEME
+
+    fragments = []
+    for text, style, control in Segment.simplify(segments):
+        if control:
+            continue
+        text = html.escape(text, quote=False)
+        if style:
+            rule = style.get_html_style(DEFAULT_TERMINAL_THEME)
+            if rule and css_classes:
+                text = f'<span class="{_css_class(rule)}">{text}</span>'
+            elif rule:
+                text = f'<span style="{rule}">{text}</span>'
+            if style.link:
+                text = f'<a href="{style.link}" target="_blank">{text}</a>'
+        fragments.append(text)
+    return rich_jupyter.JUPYTER_HTML_FORMAT.format(code="".join(fragments))
+
+
+def _rich_html(info: Info, include: InclusionChoice, div: str) -> str:
+    """Renders the Markdown text for include using the session console,
+    and returns the HTML that Rich would display in Jupyter,
+    inside the given div."""
+    from rich.segment import Segment
+
+    console = session.console
+    text = _rich_markdown(info, include)
+    width = _take_render_state().width or console.width
+    # With CSS classes, rendering also records the new style rules.
+    cache = None if CSS_CLASSES else disk_cache.get_cache()
+    if cache is not None:
+        key = _disk_cache_key(cache, "html", text, console, False, width)
+        code_html = cache.get(key)
+        if code_html is not None:
+            return div + code_html + "</div>"
+    segments = render_cache.get_segments(text, console, width=width)
+    lines = Segment.split_and_crop_lines(segments, width, pad=False)
+    segments = [segment for line in lines for segment in line]
+    code_html = _render_segments_html(segments, css_classes=CSS_CLASSES)
+    if cache is not None:
+        cache.put(key, code_html)
+    return div + code_html + "</div>"
+
+
+def message_html(info: Info, count: int = -1) -> str:
+    """HTML for the error message. By default, this is the only item shown
+    other than a button to reveal"""
+    div = "<div id='friendly-message{count}'>".format(count=count)
+    return _rich_html(info, "message", div)
+
+
+def friendly_tb_html(info: Info, count: int = -1) -> str:
+    """HTML for the friendly_tb, hidden by default"""
+    div = "<div id='friendly-tb-{name}-content{count}' style='display:none'>".format(
+        name="friendly_tb", count=count
+    )
+    return _rich_html(info, "friendly_tb", div)
+
+
+def interactive_item_html(
+    info: Info, name: InclusionChoice, count: int = -1
+) -> str:
+    """HTML for interactive items (what/why/where) with buttons to toggle
+    their visibility."""
     content = """<script type="text/Javascript"> function toggle_{name}{count}(){{
      var content = document.getElementById('friendly-tb-{name}-content{count}');
      var btn = document.getElementById('friendly-tb-btn-show-{name}{count}');
@@ -133,23 +366,36 @@ def add_interactive_item(info: Info, name: InclusionChoice, count: int = -1) ->
     """.format(
         name=name, count=count, hide=_("Hide"), btn_style=session.jupyter_button_style
     )
-    display(HTML(content))
-
-    rich_jupyter.JUPYTER_HTML_FORMAT = (
-        "<div id='friendly-tb-{name}-content{count}' style='display:none'>".format(
-            name=name, count=count
-        )
-        + old_jupyter_html_format
-        + "</div>"
+    div = "<div id='friendly-tb-{name}-content{count}' style='display:none'>".format(
+        name=name, count=count
     )
-    text = _markdown(info, include=name, rich=True)
-    rich_writer(text)
+    return content + _rich_html(info, name, div)
+
+
+def add_message(info: Info, count: int = -1) -> None:
+    """Shows the error message. By default, this is the only item shown
+    other than a button to reveal"""
+    display_html(message_html(info, count=count))
+
 
-    rich_jupyter.JUPYTER_HTML_FORMAT = old_jupyter_html_format
+def add_friendly_tb(info: Info, count: int = -1) -> None:
+    """Adds the friendly_tb, hidden by default"""
+    display_html(friendly_tb_html(info, count=count))
+
+
+def add_interactive_item(info: Info, name: InclusionChoice, count: int = -1) -> None:
+    """Adds interactive items (what/why/where) with buttons to toggle
+    their visibility."""
+    display_html(interactive_item_html(info, name, count=count))
 
 
 def add_control(count: int = -1, add_detailed_tb: bool = False) -> None:
     """Adds a single button to control the visibility of all other elements."""
+    display_html(control_html(count=count, add_detailed_tb=add_detailed_tb))
+
+
+def control_html(count: int = -1, add_detailed_tb: bool = False) -> str:
+    """HTML for a single button to control the visibility of all other elements."""
     if add_detailed_tb:
         btn_detailed_tb = """;var btn_detailed_tb =
         document.getElementById('friendly-tb-btn-show-detailed_tb{count}');""".format(
@@ -231,25 +477,460 @@ def add_control(count: int = -1, add_detailed_tb: bool = False) -> None:
         show_detailed_tb_button=show_detailed_tb_button,
         hide_detailed_tb_button=hide_detailed_tb_button,
     )
-    display(HTML(content))
+    return content
+
+
+class RenderCache:
+    """Least recently used cache of the segments rendered by Rich for a
+    given Markdown text.
+
+    The same text is often shown many times, for example when calling
+    where() repeatedly for the same traceback. Using the cached segments
+    avoids parsing the Markdown text and highlighting the code again.
+    The memory used by the cached segments, estimated in bytes, is kept
+    below ``max_size``; a value of 0 disables the cache.
+    """
+
+    # Approximate memory used by a Segment, its text and its Style,
+    # in addition to the characters of the text, in bytes.
+    SEGMENT_OVERHEAD = 200
+
+    def __init__(self, max_size: int = 8 * 2**20) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def get_segments(
+        self, text: str, console, header: bool = False, width: Optional[int] = None
+    ) -> list:
+        """Returns the segments obtained by rendering text with console,
+        using width instead of the console width if it is given."""
+        from .theme import colours, friendly_rich
+
+        if width is None:
+            width = console.width
+        theme = friendly_rich.get_console_theme(console)
+        key = (
+            text,
+            header,
+            width,
+            console.color_system,
+            console.encoding,
+            console.legacy_windows,
+            id(theme),
+            theme.background_color,
+            colours.get_highlight(theme),
+        )
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+
+        segments = _render_markdown(text, console, theme, header, width)
+        size = len(text) + sum(
+            len(segment.text) + self.SEGMENT_OVERHEAD for segment in segments
+        )
+        with self._lock:
+            if size <= self.max_size and key not in self._entries:
+                self._entries[key] = segments, size
+                self.size += size
+                while self.size > self.max_size:
+                    _key, (_segments, old_size) = self._entries.popitem(last=False)
+                    self.size -= old_size
+        return segments
+
+
+render_cache = RenderCache()
+
+
+def _render_markdown(
+    text: str, console, theme, header: bool = False, width: Optional[int] = None
+) -> list:
+    """Renders Markdown text as a list of segments."""
+    from rich.panel import Panel
+    from .theme import friendly_rich
+
+    md = friendly_rich.FriendlyMarkdown(
+        text, inline_code_lexer="python", code_theme=theme
+    )
+    if header:
+        md = Panel(md, title="Traceback")
+    options = console.options
+    if width is not None:
+        options = options.update_width(width)
+    segments = []
+    for segment in console.render(md, options):
+        segments.append(segment)
+        if len(segments) % 256 == 0:
+            time_budget.check("render")
+    return segments
 
 
 def rich_writer(text: str) -> None:  # pragma: no cover
     """Default writer"""
-    global RICH_HEADER, WIDE_OUTPUT
+    from rich.text import Text
+
+    state = _take_render_state()
+    console = session.console
     if session.rich_add_vspace:
-        session.console.print()
-    md = Markdown(
-        text, inline_code_lexer="python", code_theme=friendly_pygments.CURRENT_THEME
+        console.print()
+    try:
+        if not state.plain:
+            with time_budget.applied(state.budget):
+                _rich_write(text, console, state)
+            return
+    except time_budget.BudgetExceeded as e:
+        text = time_budget.fallback(state.budget, e.stage)
+    console.print(Text(text), crop=False, soft_wrap=True, end="")
+
+
+def _rich_write(text: str, console, state: RenderState) -> None:
+    """Renders the Markdown text and writes it to console."""
+    from rich.segment import Segment, Segments
+
+    cache = disk_cache.get_cache()
+    if cache is not None and _use_minimal_ansi(console):
+        key = _disk_cache_key(
+            cache, "ansi", text, console, state.header, state.width
+        )
+        ansi = cache.get(key)
+        if ansi is None:
+            ansi = _terminal_ansi(text, console, state)
+            cache.put(key, ansi)
+        console.print(Segments([Segment(ansi)]), crop=False)
+        return
+    segments = render_cache.get_segments(
+        text, console, header=state.header, width=state.width
+    )
+    if MINIMAL_ANSI and _use_minimal_ansi(console):
+        background = _minimal_background(console)
+        ansi = minimal_ansi(segments, console.color_system, background)
+        # The escape codes would be counted as text when cropping lines.
+        console.print(Segments([Segment(ansi)]), crop=False)
+    else:
+        # The segments are already cropped to the width used to render them,
+        # which can be larger than that of the console.
+        console.print(Segments(segments), crop=state.width is None)
+
+
+def _terminal_ansi(text: str, console, state: RenderState) -> str:
+    """Returns what rich_writer would write to a terminal for text,
+    including the ANSI codes."""
+    from rich.segment import Segments
+
+    segments = render_cache.get_segments(
+        text, console, header=state.header, width=state.width
+    )
+    if MINIMAL_ANSI:
+        background = _minimal_background(console)
+        return minimal_ansi(segments, console.color_system, background)
+    with console.capture() as capture:
+        console.print(Segments(segments), crop=state.width is None)
+    return capture.get()
+
+
+def _minimal_background(console) -> str:
+    from .theme import friendly_rich
+
+    if MINIMAL_ANSI_BACKGROUND is not None:
+        return MINIMAL_ANSI_BACKGROUND
+    return friendly_rich.get_console_theme(console).background_color
+
+
+def _disk_cache_key(
+    cache, kind: str, text: str, console, header: bool, width: Optional[int]
+) -> str:
+    """Key of the disk cache for the output of kind obtained by rendering
+    text; the values are those used by RenderCache, except that the theme
+    is identified by its content rather than by its id."""
+    from .theme import colours, friendly_rich
+
+    theme = friendly_rich.get_console_theme(console)
+    return cache.key(
+        kind,
+        text,
+        header,
+        width or console.width,
+        console.color_system,
+        console.encoding,
+        console.legacy_windows,
+        theme.__name__,
+        sorted((str(token), style) for token, style in theme.styles.items()),
+        theme.background_color,
+        colours.get_highlight(theme),
+        MINIMAL_ANSI,
+        MINIMAL_ANSI_BACKGROUND,
+    )
+
+
+def use_minimal_ansi(minimal: bool = True, background: Optional[str] = None) -> None:
+    """When minimal is True, the ANSI codes written to a terminal are
+    reduced to the strict minimum: only the changes of style are written
+    and the background colour is omitted where it is the same as the
+    default background of the terminal. This makes the output several
+    times smaller, which matters for log files and slow connections.
+
+    By default, the terminal background is assumed to be the background
+    colour of the theme, as set by set_background().
+    """
+    global MINIMAL_ANSI, MINIMAL_ANSI_BACKGROUND
+    MINIMAL_ANSI = minimal
+    MINIMAL_ANSI_BACKGROUND = background
+
+
+def _use_minimal_ansi(console) -> bool:
+    """The minimal codes are only written where Rich would write
+    ANSI codes itself."""
+    return (
+        console.is_terminal
+        and console.color_system not in (None, "windows")
+        and not console.is_jupyter
+        and not console.record
+        and not console.legacy_windows
+    )
+
+
+# SGR code turning off each attribute; 22 turns off both bold and dim.
+_SGR_OFF = {
+    "1": "22",
+    "2": "22",
+    "3": "23",
+    "4": "24",
+    "5": "25",
+    "6": "25",
+    "7": "27",
+    "8": "28",
+    "9": "29",
+    "21": "24",
+    "51": "54",
+    "52": "54",
+    "53": "55",
+}
+_SGR_ATTRIBUTES = [
+    ("bold", "1"),
+    ("dim", "2"),
+    ("italic", "3"),
+    ("underline", "4"),
+    ("blink", "5"),
+    ("blink2", "6"),
+    ("reverse", "7"),
+    ("conceal", "8"),
+    ("strike", "9"),
+    ("underline2", "21"),
+    ("frame", "51"),
+    ("encircle", "52"),
+    ("overline", "53"),
+]
+_VISIBLE_ON_SPACES = frozenset(["4", "7", "8", "9", "21", "51", "52", "53"])
+_NO_STYLE = (frozenset(), (), ())
+
+
+def minimal_ansi(segments, color_system: str = "truecolor", background=None) -> str:
+    """Returns the text of Rich segments with as few ANSI codes as possible.
+
+    Adjacent segments with the same style are merged, and only the
+    codes needed to go from one style to the next are written.
+    Background colours equal to ``background`` are omitted.
+    All styles are reset at the end of each line, so that every line
+    of a log file can be read on its own.
+    """
+    from rich.color import Color
+    from rich.console import COLOR_SYSTEMS
+    from rich.segment import Segment
+
+    system = COLOR_SYSTEMS[color_system]
+    default_bgcolor = ()
+    if background is not None:
+        default_bgcolor = tuple(
+            Color.parse(background).downgrade(system).get_ansi_codes(foreground=False)
+        )
+    states = {}
+
+    def get_state(style):
+        if style not in states:
+            attributes = frozenset(
+                code for name, code in _SGR_ATTRIBUTES if getattr(style, name)
+            )
+            color = bgcolor = ()
+            if style.color is not None:
+                color = tuple(style.color.downgrade(system).get_ansi_codes())
+            if style.bgcolor is not None:
+                bgcolor = tuple(
+                    style.bgcolor.downgrade(system).get_ansi_codes(foreground=False)
+                )
+                if bgcolor == default_bgcolor:
+                    bgcolor = ()
+            states[style] = attributes, color, bgcolor
+        return states[style]
+
+    output = []
+    current = _NO_STYLE
+    for text, style, control in Segment.simplify(segments):
+        if control:
+            output.append(text)
+            continue
+        state = get_state(style) if style else _NO_STYLE
+        for n, line in enumerate(text.split("\n")):
+            if n:
+                if current != _NO_STYLE:
+                    output.append("\x1b[0m")
+                    current = _NO_STYLE
+                output.append("\n")
+            if not line:
+                continue
+            if state != current and not (
+                line.isspace() and _looks_blank(current) == _looks_blank(state)
+            ):
+                output.append(_sgr_change(current, state))
+                current = state
+            if style and style.link:
+                line = f"\x1b]8;;{style.link}\x1b\\{line}\x1b]8;;\x1b\\"
+            output.append(line)
+    if current != _NO_STYLE:
+        output.append("\x1b[0m")
+    return "".join(output)
+
+
+def _looks_blank(state: tuple) -> tuple:
+    """Returns the part of a style which is visible on spaces:
+    the foreground colour of spaces does not matter, unless reversed."""
+    attributes, color, bgcolor = state
+    visible = attributes & _VISIBLE_ON_SPACES
+    if "7" in visible:
+        return visible, color, bgcolor
+    return visible, (), bgcolor
+
+
+def _sgr_change(old: tuple, new: tuple) -> str:
+    """Returns the shortest escape sequence changing the style old into new,
+    either by changing only what differs or by resetting everything."""
+    old_attributes, old_color, old_bgcolor = old
+    attributes, color, bgcolor = new
+
+    reset = ["0", *sorted(attributes), *color, *bgcolor]
+    if old == _NO_STYLE:
+        reset.pop(0)
+
+    off = {_SGR_OFF[code] for code in old_attributes - attributes}
+    kept = {code for code in old_attributes if _SGR_OFF[code] not in off}
+    delta = sorted(off) + sorted(attributes - kept)
+    if color != old_color:
+        delta.extend(color or ["39"])
+    if bgcolor != old_bgcolor:
+        delta.extend(bgcolor or ["49"])
+
+    codes = min(delta, reset, key=lambda codes: len(";".join(codes)))
+    return "\x1b[" + ";".join(codes) + "m"
+
+
+def render(
+    info: Info,
+    formatter: str = "dark",
+    include: InclusionChoice = "friendly_tb",
+    width: int = 80,
+    color_system: str = "truecolor",
+    output: str = "ansi",
+) -> str:
+    """Returns the traceback information formatted as a string.
+
+    Unlike the other formatters, this does not use nor modify the console
+    used by friendly, so that it can be used from any thread.
+    For the Rich-based formatters, "dark" and "light", output can be
+    "ansi" (text with colour codes), "minimal_ansi" (the same, with fewer
+    codes; see use_minimal_ansi()), "html" or "text".
+    Other formatters ("plain", "markdown", "docs", "json") always return text.
+    """
+    sections = render_sections(
+        info,
+        sections=[include],
+        formatter=formatter,
+        width=width,
+        color_system=color_system,
+        output=output,
+    )
+    return sections[include]
+
+
+SECTIONS = ["message", "friendly_tb", "what", "why", "where", "detailed_tb"]
+
+
+def render_sections(
+    info: Info,
+    sections: list = SECTIONS,
+    formatter: str = "dark",
+    width: int = 80,
+    color_system: str = "truecolor",
+    output: str = "ansi",
+) -> dict:
+    """Same as render(), but returns a dict containing the result for each
+    of the sections, which are include values.
+
+    This is faster than calling render() for each section: code blocks
+    which are part of more than one section, such as the source of
+    the line where the exception was raised, are highlighted only once.
+    """
+    text_formatters = {
+        "plain": repl,
+        "repl": repl,
+        "docs": docs,
+        "markdown": markdown,
+        "markdown_docs": markdown_docs,
+        "json": json_lines,
+    }
+    if formatter in text_formatters:
+        return {
+            section: text_formatters[formatter](info, section) for section in sections
+        }
+    if formatter not in ["dark", "light"]:
+        raise ValueError(f"Unknown formatter: {formatter}")
+    if output not in ["ansi", "minimal_ansi", "html", "text"]:
+        raise ValueError(f"Unknown output: {output}")
+
+    from rich.segment import Segments
+    from .theme import friendly_pygments, friendly_rich
+
+    if formatter == "light":
+        theme = friendly_pygments.friendly_light
+    else:
+        theme = friendly_pygments.friendly_dark
+    console = friendly_rich.new_console(
+        theme,
+        file=io.StringIO(),
+        width=width,
+        color_system=color_system,
+        force_terminal=True,
+        force_jupyter=False,
+        legacy_windows=False,
+        record=output in ["html", "text"],
     )
-    if RICH_HEADER:
-        title = "Traceback"
-        md = Panel(md, title=title)
-        RICH_HEADER = False
-    session.console.print(md)
-    if WIDE_OUTPUT:
-        session.console.width = session.rich_width
-        WIDE_OUTPUT = False
+    results = {}
+    with friendly_rich.shared_code_blocks():
+        for section in sections:
+            text = _markdown(info, section, rich=True)
+            segments = render_cache.get_segments(
+                text, console, header=(section == "explain")
+            )
+            if output == "minimal_ansi":
+                results[section] = minimal_ansi(
+                    segments, color_system, theme.background_color
+                )
+                continue
+            console.print(Segments(segments))
+            if output == "html":
+                results[section] = console.export_html(inline_styles=True)
+            elif output == "text":
+                results[section] = console.export_text()
+            else:
+                results[section] = console.file.getvalue()
+                console.file.seek(0)
+                console.file.truncate()
+    return results
 
 
 def html_escape(text: str) -> str:  # pragma: no cover
@@ -280,21 +961,19 @@ def jupyter(
     However, some information shown may be less than optimal
     when it comes to visibility/contrast.
     """
-    css = HtmlFormatter().get_style_defs(".highlight")
-    display(HTML(f"<style>{css}</style>"))  # noqa
+    global _jupyter_css_sent
+    if not _jupyter_css_sent:
+        display_html(f"<style>{_pygments_tools()['css']}</style>")
+        _jupyter_css_sent = True
     items_to_show = select_items(include)
     result = False
     for item in items_to_show:
         if item in info:
             result = True
             if "source" in item or "variable" in item:
-                text = info[item]
-                text = highlight(text, PythonLexer(), HtmlFormatter())
-                display(HTML(text))
+                display_html(highlight_html(info[item], "python"))
             elif "traceback" in item:
-                text = info[item]
-                text = highlight(text, PythonTracebackLexer(), HtmlFormatter())
-                display(HTML(text))
+                display_html(highlight_html(info[item], "pytb"))
             elif "message" in item:  # format like last line of traceback
                 content = info[item].split(":")
                 error_name = content[0]
@@ -308,20 +987,20 @@ def jupyter(
                         "</span></pre></div>",
                     ]
                 )
-                display(HTML(text))
+                display_html(text)
             elif item == "suggest":
                 text = html_escape(info[item])
-                display(HTML(f"<p><i>{text}</i></p>"))
+                display_html(f"<p><i>{text}</i></p>")
             else:
                 text = html_escape(info[item])
                 if "header" in item:
-                    display(HTML(f"<p><b>{text}</b></p>"))
+                    display_html(f"<p><b>{text}</b></p>")
                 else:
-                    display(HTML(f'<p style="width: 70ch">{text}</p>'))
+                    display_html(f'<p style="width: 70ch">{text}</p>')
     if not result:
         text = no_result(info, include)
         if text:
-            display(HTML(f'<p style="width: 70ch;">{text}</p>'))
+            display_html(f'<p style="width: 70ch;">{text}</p>')
     return ""
 
 
@@ -329,6 +1008,42 @@ if not ipython_available:
     jupyter = repl  # noqa
 
 
+@functools.lru_cache(maxsize=None)
+def _pygments_tools() -> dict:
+    """Lexers, formatter and style sheet used by jupyter(), created once."""
+    from pygments.lexers import PythonLexer, PythonTracebackLexer
+    from pygments.formatters import HtmlFormatter
+    from .theme import patch_tb_lexer  # noqa
+
+    formatter = HtmlFormatter()
+    return {
+        "python": PythonLexer(),
+        "pytb": PythonTracebackLexer(),
+        "formatter": formatter,
+        "css": formatter.get_style_defs(".highlight"),
+    }
+
+
+@functools.lru_cache(maxsize=256)
+def highlight_html(text: str, lexer_name: str) -> str:
+    """Returns the HTML for text highlighted by Pygments, using the
+    "python" or "pytb" (traceback) lexer. The most recent results are cached
+    since the same errors are often seen repeatedly in a notebook."""
+    from pygments import highlight
+
+    cache = disk_cache.get_cache()
+    if cache is not None:
+        key = cache.key("pygments", text, lexer_name)
+        result = cache.get(key)
+        if result is not None:
+            return result
+    tools = _pygments_tools()
+    result = highlight(text, tools[lexer_name], tools["formatter"])
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
 def markdown(
     info: Info, include: InclusionChoice = "friendly_tb"
 ) -> str:  # pragma: no cover
@@ -356,6 +1071,71 @@ def markdown_docs(
     return _markdown(info, include, documentation=True)
 
 
+def json_lines(info: Info, include: InclusionChoice = "explain") -> str:
+    """Traceback information as a single line containing a compact JSON
+    object, meant to be appended to a log file or sent to a log pipeline.
+
+    The object contains the exception name, the message, a fingerprint
+    (see fingerprint()), the items selected by include, and timings:
+    the time at which it was formatted, in seconds since the epoch,
+    and the time needed to format it, in milliseconds.
+    """
+    start = time.perf_counter()
+    record = {
+        "exception": exception_name(info),
+        "message": info.get("message", "").strip(),
+        "fingerprint": fingerprint(info),
+        "include": include,
+    }
+    for item in _json_items(include):
+        if item in info:
+            record[item] = info[item]
+    record["timings"] = {
+        "time": round(time.time(), 3),
+        "format_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+    return _json_encoder.encode(record) + "\n"
+
+
+_json_encoder = json.JSONEncoder(separators=(",", ":"), default=str)
+
+
+@functools.lru_cache(maxsize=None)
+def _json_items(include: InclusionChoice) -> tuple:
+    """Info items included in the JSON object, other than the message."""
+    if include == "detailed_tb":
+        return ("detailed_tb",)
+    return tuple(item for item in select_items(include) if item != "message")
+
+
+def exception_name(info: Info) -> str:
+    """Returns the name of the exception, as shown in its message."""
+    return info.get("message", "").split(":", 1)[0].strip()
+
+
+def fingerprint(info: Info) -> str:
+    """Returns a short hash identifying an exception by its name, its
+    message template and the location where it was raised: the same error
+    raised again at the same place has the same fingerprint, even if the
+    values shown in the message are different.
+    """
+    traceback = info.get("original_python_traceback", "")
+    locations = [line for line in traceback.split("\n") if line.startswith("  File ")]
+    key = "\n".join(
+        [exception_name(info), message_template(info), *locations[-1:]]
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+_message_values = re.compile(r"'[^']*'|\"[^\"]*\"|\b\d+(?:\.\d+)?\b")
+
+
+def message_template(info: Info) -> str:
+    """Returns the message of the exception, with the quoted strings
+    and numbers it contains replaced by "?"."""
+    return _message_values.sub("?", info.get("message", "").strip())
+
+
 def rich_markdown(
     info: Info, include: InclusionChoice = "friendly_tb"
 ) -> str:  # pragma: no cover
@@ -369,6 +1149,25 @@ def rich_markdown(
     Some additional processing is done just prior to doing the
     final output, by ``session._write_err()``.
     """
+    return _rich_markdown(info, include)
+
+
+def _rich_markdown(info: Info, include: InclusionChoice) -> str:
+    """Markdown text to be shown by rich_writer, using the session console.
+
+    How it must be rendered is recorded in the render state of the
+    current context, to be used by the writer.
+    """
+    width = None
+    if (
+        session.is_jupyter
+        and session.rich_tb_width is not None
+        and session.rich_tb_width != session.rich_width
+        and include in ["friendly_tb", "python_tb", "debug_tb", "where", "explain"]
+    ):
+        width = session.rich_tb_width
+    # For explain, the header is skipped here and shown by the writer.
+    _render_state.set(RenderState(header=include == "explain", width=width))
     return _markdown(info, include, rich=True)
 
 
@@ -392,6 +1191,102 @@ def detailed_tb(info: Info) -> str:  # Special case
     return "\n".join(result)
 
 
+MARKDOWN_ITEMS = {
+    "header": ("# ", ""),
+    "message": ("", ""),
+    "suggest": ("", "\n"),
+    "warning_message": ("", "\n"),
+    "exception_notes_intro": ("#### ", ""),
+    "exception_notes": ("", ""),
+    "generic": ("", ""),
+    "parsing_error": ("", ""),
+    "parsing_error_source": ("```python\n", "\n```"),
+    "cause": ("", ""),
+    "last_call_header": ("## ", ""),
+    "last_call_source": ("```python\n", "\n```"),
+    "last_call_variables": ("```python\n", "\n```"),
+    "exception_raised_header": ("## ", ""),
+    "exception_raised_source": ("```python\n", "\n```"),
+    "exception_raised_variables": ("```python\n", "\n```"),
+    "simulated_python_traceback": ("```pytb\n", "\n```"),
+    "original_python_traceback": ("```pytb\n", "\n```"),
+    "shortened_traceback": ("```pytb\n", "\n```"),
+    "warning_location_header": ("#### ", ""),
+    "warning_source": ("```python\n", "\n```"),
+    "warning_variables": ("```python\n", "\n```"),
+    "additional_variable_warning": ("#### ", ""),
+}
+
+
+def _header_markdown(content: str) -> str:
+    # With normal Markdown formatting, it does not make sense to have a
+    # header end with a colon.
+    # However, we style headers differently with Rich; see
+    # Rich theme in file friendly_rich.
+    return (
+        content.rstrip(":")
+        .replace("' ", "'` ")
+        .replace(" '", " `'")
+        .replace("'.", "'`.")
+    )
+
+
+def _message_markdown(content: str) -> str:
+    # Ensure that the exception name is highlighted.
+    content = content.split(":")
+    content[0] = "`" + content[0] + "`"
+    return ":".join(content)
+
+
+def _brackets_markdown(content: str) -> str:
+    if "[" in content:
+        content = content.replace("[", "`[").replace("]", "]`")
+    return content
+
+
+def _notes_markdown(notes: list) -> str:
+    lines = []
+    for note in notes:
+        note_lines = note.split("\n")
+        for index, line in enumerate(note_lines):
+            if index == 0:
+                note_lines[0] = "* " + note_lines[0]
+            else:
+                note_lines[index] = " " + note_lines[index]
+        note_lines.append("\n")
+
+        lines.extend(note_lines)
+    lines.append("\n")
+    return "".join(lines)
+
+
+@functools.lru_cache(maxsize=None)
+def _markdown_plan(
+    include: InclusionChoice, rich: bool = False, documentation: bool = False
+) -> tuple:
+    """Returns, for each item shown by _markdown(), a tuple containing
+    the item name, the prefix and suffix added to its content, and the
+    functions transforming its content. The prefix is None for unknown items.
+    """
+    plan = []
+    for item in select_items(include):
+        if item not in MARKDOWN_ITEMS:
+            plan.append((item, None, None, ()))
+            continue
+        prefix, suffix = MARKDOWN_ITEMS[item]
+        transforms = []
+        if item.endswith("header"):
+            transforms.append(_header_markdown)
+        if item == "message" and rich:
+            transforms.append(_message_markdown)
+        if "header" in item or item == "parsing_error":
+            transforms.append(_brackets_markdown)
+        if documentation and prefix.startswith("#"):
+            prefix = "##" + prefix
+        plan.append((item, prefix, suffix, tuple(transforms)))
+    return tuple(plan)
+
+
 def _markdown(
     info: Info,
     include: InclusionChoice,
@@ -399,52 +1294,17 @@ def _markdown(
     documentation: bool = False,
 ) -> str:  # pragma: no cover
     """Traceback formatted with Markdown syntax."""
-    global RICH_HEADER, WIDE_OUTPUT
     if include == "detailed_tb" and "detailed_tb" in info:
         return detailed_tb(info)
     elif include == "detailed_tb":
         return ""
-    if (
-        rich
-        and session.is_jupyter
-        and session.rich_tb_width is not None
-        and session.rich_tb_width != session.rich_width
-        and include in ["friendly_tb", "python_tb", "debug_tb", "where", "explain"]
-    ):
-        session.console.width = session.rich_tb_width
-        WIDE_OUTPUT = True
-    markdown_items = {
-        "header": ("# ", ""),
-        "message": ("", ""),
-        "suggest": ("", "\n"),
-        "warning_message": ("", "\n"),
-        "exception_notes_intro": ("#### ", ""),
-        "exception_notes": ("", ""),
-        "generic": ("", ""),
-        "parsing_error": ("", ""),
-        "parsing_error_source": ("```python\n", "\n```"),
-        "cause": ("", ""),
-        "last_call_header": ("## ", ""),
-        "last_call_source": ("```python\n", "\n```"),
-        "last_call_variables": ("```python\n", "\n```"),
-        "exception_raised_header": ("## ", ""),
-        "exception_raised_source": ("```python\n", "\n```"),
-        "exception_raised_variables": ("```python\n", "\n```"),
-        "simulated_python_traceback": ("```pytb\n", "\n```"),
-        "original_python_traceback": ("```pytb\n", "\n```"),
-        "shortened_traceback": ("```pytb\n", "\n```"),
-        "warning_location_header": ("#### ", ""),
-        "warning_source": ("```python\n", "\n```"),
-        "warning_variables": ("```python\n", "\n```"),
-        "additional_variable_warning": ("#### ", ""),
-    }
 
-    items_to_show = select_items(include)  # tb_items_to_show(level=level)
-    if rich and include == "explain":
-        RICH_HEADER = True  # Skip it here; handled by session.py
     result = [""]
-    for item in items_to_show:
-        if item not in markdown_items:
+    for item, prefix, suffix, transforms in _markdown_plan(
+        include, rich, documentation
+    ):
+        time_budget.check("markdown")
+        if prefix is None:
             print(
                 _(
                     "Inconsistent values: {item} is not present in markdown_items.\n"
@@ -453,49 +1313,14 @@ def _markdown(
                 ).format(item=item)
             )
             continue
-        prefix, suffix = markdown_items[item]
-        if item == "exception_notes" and item in info:
-            lines = []
-            for note in info[item]:
-                note_lines = note.split("\n")
-                for index, line in enumerate(note_lines):
-                    if index == 0:
-                        note_lines[0] = "* " + note_lines[0]
-                    else:
-                        note_lines[index] = " " + note_lines[index]
-                note_lines.append("\n")
-
-                lines.extend(note_lines)
-            lines.append("\n")
-            content = "".join(lines)
-            result.append(prefix + content + suffix)
-        elif item in info and info[item].strip():
-            # With normal Markdown formatting, it does not make sense to have a
-            # header end with a colon.
-            # However, we style headers differently with Rich; see
-            # Rich theme in file friendly_rich.
-            content = info[item]
-            if item.endswith("header"):
-                content = (
-                    content.rstrip(":")
-                    .replace("' ", "'` ")
-                    .replace(" '", " `'")
-                    .replace("'.", "'`.")
-                )
-            if item == "message" and rich:
-                # Ensure that the exception name is highlighted.
-                content = content.split(":")
-                content[0] = "`" + content[0] + "`"
-                content = ":".join(content)
-
-            if "header" in item and "[" in content:
-                content = content.replace("[", "`[").replace("]", "]`")
-
-            if item == "parsing_error" and "[" in content:
-                content = content.replace("[", "`[").replace("]", "]`")
-
-            if documentation and prefix.startswith("#"):
-                prefix = "##" + prefix
+        if item not in info:
+            continue
+        content = info[item]
+        if item == "exception_notes":
+            result.append(prefix + _notes_markdown(content) + suffix)
+        elif content.strip():
+            for transform in transforms:
+                content = transform(content)
             result.append(prefix + content + suffix)
 
     if result == [""]:
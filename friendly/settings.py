@@ -1,12 +1,31 @@
-"""Settings file exclusively for friendly -- not for friendly-traceback"""
+"""Settings file exclusively for friendly -- not for friendly-traceback
+
+By default, the settings are saved in a file shared by all processes.
+This can be changed using the environment variable FRIENDLY_SETTINGS:
+
+* FRIENDLY_SETTINGS=file: the default.
+* FRIENDLY_SETTINGS=memory: settings are only kept in memory for the
+  duration of the process; nothing is read from or written to disk.
+* FRIENDLY_SETTINGS=env: as with memory, but the initial values are taken
+  from environment variables such as FRIENDLY_SETTING_FORMATTER=dark.
+"""
 
 import configparser
+import contextlib
 import locale
 import os
+import stat
 import sys
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # Windows: changes to the settings file are not locked.
 
 from friendly_traceback import debug_helper
-from friendly_traceback.config import session
 import platformdirs
 
 
@@ -39,30 +58,304 @@ ENVIRONMENT = terminal_type
 # If a terminal type is identified, then the ENVIRONMENT variable
 # would usually be a combination of the terminal_type and the flavour.
 
-# Perhaps friendly will be used in environments where the user cannot
-# create settings directories and files
+LOCK_TIMEOUT = 5  # seconds
+
+
+def _copy_config(config):
+    """Returns a copy of parsed settings that can safely be modified
+    without affecting the original."""
+    new_config = configparser.ConfigParser()
+    new_config.read_dict(config)
+    return new_config
+
+
+# The settings are kept by a backend. Every backend has the same interface:
+#
+#     load() -> ConfigParser, the current settings, not to be modified
+#     store(changes) applies a list of changes; each change is a function
+#                    modifying a ConfigParser instance in place.
+#     clear_cache()
+
+
+class FileBackend:
+    """Settings saved in a file shared by all processes.
+
+    Parsing the file is comparatively expensive and it is read on hot
+    paths, such as every time a code block is rendered with Rich.
+    We keep the parsed content in memory and only re-read the file if its
+    modification time or size has changed, which can happen if another
+    process has updated it.
+
+    Many processes (for example, several Jupyter kernels) can share the
+    same settings file. To avoid losing updates, each read-modify-write
+    cycle is done while holding an advisory lock on a separate file,
+    since the settings file itself is replaced on each write.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.clear_cache()
+
+    def ensure_existence(self):
+        """Ensures that a settings file exists"""
+        directory = os.path.dirname(self.filename)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        if not os.path.exists(self.filename):
+            config = configparser.ConfigParser()
+            with open(self.filename, "w") as config_file:
+                config.write(config_file)
+
+    def clear_cache(self):
+        """Forces the settings file to be read again on the next access."""
+        self._stamp = None
+        self._config = None
+
+    def _file_stamp(self):
+        """Returns a value identifying the current version of the file."""
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read_file(self):
+        """Parses the settings file, without using the cached content."""
+        config = configparser.ConfigParser()
+        config.read(self.filename)
+        return config
+
+    def load(self):
+        """Returns the parsed settings file, re-reading it only if needed."""
+        stamp = self._file_stamp()
+        if self._config is None or stamp is None or stamp != self._stamp:
+            self._config = self._read_file()
+            self._stamp = stamp
+        return self._config
+
+    def _save(self, config):
+        """Writes the settings file and updates the cached content.
+
+        The content is first written to a temporary file which then replaces
+        the settings file, so that a concurrent reader never sees a partially
+        written file.
+        """
+        fd, temp_name = tempfile.mkstemp(
+            dir=os.path.dirname(self.filename), prefix=".friendly-", suffix=".ini"
+        )
+        try:
+            with os.fdopen(fd, "w") as config_file:
+                config.write(config_file)
+            # mkstemp creates the file readable only by its owner.
+            with contextlib.suppress(FileNotFoundError):
+                mode = stat.S_IMODE(os.stat(self.filename).st_mode)
+                os.chmod(temp_name, mode)
+            os.replace(temp_name, self.filename)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temp_name)
+            raise
+        self._config = config
+        self._stamp = self._file_stamp()
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """Locks the settings file for writing, waiting at most LOCK_TIMEOUT
+        seconds for other processes to release it. If the lock cannot be
+        acquired in time, we proceed anyway rather than blocking the user.
+        """
+        if fcntl is None:
+            yield
+            return
+        try:
+            lock_file = open(self.filename + ".lock", "a")
+        except OSError:
+            yield
+            return
+        with lock_file:
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            locked = False
+            while not locked:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except OSError:
+                    if time.monotonic() > deadline:
+                        debug_helper.log("Timeout: could not lock the settings file.")
+                        break
+                    time.sleep(0.001)
+            try:
+                yield
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def store(self, changes):
+        """Applies changes to the latest version of the settings file and saves it."""
+        with self._lock():
+            # Another process might have modified the file since we last read it.
+            config = self._read_file()
+            for change in changes:
+                change(config)
+            self._save(config)
+
+
+class MemoryBackend:
+    """Settings kept in memory only, for the duration of the process.
+    Nothing is read from or written to disk.
+    """
+
+    def __init__(self):
+        self._config = configparser.ConfigParser()
+        self._store_lock = threading.Lock()
+
+    def clear_cache(self):
+        pass
+
+    def load(self):
+        return self._config
+
+    def store(self, changes):
+        with self._store_lock:
+            config = _copy_config(self._config)
+            for change in changes:
+                change(config)
+            self._config = config
+
+
+class EnvironmentBackend(MemoryBackend):
+    """Settings taken from environment variables, such as::
+
+        FRIENDLY_SETTING_FORMATTER=dark
+
+    which apply to all environments (sections). As with MemoryBackend,
+    changes are only kept in memory.
+    """
+
+    prefix = "FRIENDLY_SETTING_"
+
+    def __init__(self, environ=None):
+        super().__init__()
+        if environ is None:
+            environ = os.environ
+        defaults = self._config[self._config.default_section]
+        for name, value in environ.items():
+            if name.startswith(self.prefix):
+                defaults[name[len(self.prefix) :]] = value
+        # Default values are only seen in existing sections. Each section
+        # is added only once, so that it can then be removed.
+        self._added_sections = set()
+        self._add_section("common")
+
+    def _add_section(self, section):
+        if section in self._added_sections or not self._config.defaults():
+            return
+        self._added_sections.add(section)
+        if not self._config.has_section(section):
+            self.store([lambda config: config.add_section(section)])
+
+    def load(self):
+        # ENVIRONMENT can be set after the backend is created.
+        if ENVIRONMENT is not None:
+            self._add_section(ENVIRONMENT)
+        return self._config
+
+
+def _select_backend():
+    """Chooses the backend based on the environment variable FRIENDLY_SETTINGS,
+    whose value can be "file" (the default), "memory" or "env".
+    """
+    choice = os.environ.get("FRIENDLY_SETTINGS", "file").lower()
+    if choice == "memory":
+        return MemoryBackend()
+    elif choice in ["env", "environment"]:
+        return EnvironmentBackend()
+    elif choice != "file":
+        debug_helper.log(f"Unknown value: FRIENDLY_SETTINGS={choice}")
+    file_backend = FileBackend(FILENAME)
+    try:
+        file_backend.ensure_existence()
+    except Exception:  # noqa
+        # Perhaps friendly is used in an environment where the user cannot
+        # create settings directories and files
+        return MemoryBackend()
+    return file_backend
+
+
+def set_backend(new_backend):
+    """Replaces the object used to keep the settings."""
+    global backend, FILENAME
+    backend = new_backend
+    FILENAME = getattr(backend, "filename", None)
+
+
+set_backend(_select_backend())
 
 
 def ensure_existence():
     """Ensures that a settings file exists"""
-    if not os.path.exists(config_dir):
-        os.makedirs(config_dir)
-    if not os.path.exists(FILENAME):
-        config = configparser.ConfigParser()
-        with open(FILENAME, "w") as config_file:
-            config.write(config_file)
+    if isinstance(backend, FileBackend):
+        backend.ensure_existence()
 
 
-try:
-    ensure_existence()
-except Exception:  # noqa
-    FILENAME = None
+class _TransactionState(threading.local):
+    """Changes made inside a transaction, not yet saved."""
+
+    def __init__(self):
+        self.depth = 0
+        self.changes = []
+        self.config = None  # settings with the changes applied
+
+
+_transaction = _TransactionState()
+
+
+@contextlib.contextmanager
+def transaction():
+    """Groups together changes to the settings so that the settings file
+    is written only once, when the outermost transaction ends.
+
+    Changes made before an exception is raised inside the transaction are
+    still saved, as they would have been if no transaction had been used.
+    """
+    _transaction.depth += 1
+    try:
+        yield
+    finally:
+        _transaction.depth -= 1
+        if not _transaction.depth and _transaction.changes:
+            changes, _transaction.changes = _transaction.changes, []
+            _transaction.config = None
+            backend.store(changes)
+
+
+def _current_config():
+    """Returns the settings as seen by the current thread, including
+    changes made inside a transaction not yet completed."""
+    if _transaction.config is not None:
+        return _transaction.config
+    return backend.load()
+
+
+def _modify_config(change):
+    """Applies ``change`` to the settings and saves the result,
+    unless a transaction is in progress."""
+    if _transaction.depth:
+        if _transaction.config is None:
+            _transaction.config = _copy_config(backend.load())
+        change(_transaction.config)
+        _transaction.changes.append(change)
+        return
+    backend.store([change])
+
+
+def clear_cache():
+    """Forces the settings to be read again on the next access."""
+    backend.clear_cache()
 
 
 def read(*, option="unknown", environment=None):
     """Returns the value of a key in the current environment"""
-    if FILENAME is None:
-        return getattr(session, option) if hasattr(session, option) else None
     if environment is not None:
         section = environment
     elif ENVIRONMENT is not None:
@@ -70,8 +363,7 @@ def read(*, option="unknown", environment=None):
     else:
         section = "unknown"
         debug_helper.log(f"Reading unknown section: {option}")
-    config = configparser.ConfigParser()
-    config.read(FILENAME)
+    config = _current_config()
     if section in config and option in config[section]:
         return config[section][option]
     return
@@ -88,9 +380,6 @@ def write(*, option="unknown", value="unknown", environment=None):
     if not isinstance(value, str):
         debug_helper.log(f"value = {value} is not a string.")
         return
-    if FILENAME is None:
-        setattr(session, option, value)
-        return
     if environment is not None:
         section = environment
     elif ENVIRONMENT is not None:
@@ -99,19 +388,20 @@ def write(*, option="unknown", value="unknown", environment=None):
         section = "unknown"
         debug_helper.log(f"writing unknown for environment={environment}")
 
-    config = configparser.ConfigParser()
-    config.read(FILENAME)
-    if not config.has_section(section):
-        config.add_section(section)
-    config[section][option] = value
-    with open(FILENAME, "w") as config_file:
-        config.write(config_file)
+    config = _current_config()
+    if config.has_section(section) and config[section].get(option) == value:
+        return
+
+    def change(config):
+        if not config.has_section(section):
+            config.add_section(section)
+        config[section][option] = value
+
+    _modify_config(change)
 
 
 def _remove_environment(environment=None):
     """Removes an environment (option) previously saved."""
-    if FILENAME is None:
-        return
     if environment is not None:
         section = environment
     elif ENVIRONMENT is not None:
@@ -119,31 +409,21 @@ def _remove_environment(environment=None):
     else:
         print("No environment defined.")
         return
-    config = configparser.ConfigParser()
-    config.read(FILENAME)
-    config.remove_section(section)
-    with open(FILENAME, "w") as config_file:
-        config.write(config_file)
+    _modify_config(lambda config: config.remove_section(section))
 
 
 def has_environment(environment=None):
     """Returns True if a section in the settings file has already been set
     for this environment.
     """
-    if FILENAME is None:
-        return False
     section = environment if environment is not None else ENVIRONMENT
-    config = configparser.ConfigParser()
-    config.read(FILENAME)
-    return config.has_section(section)
+    return _current_config().has_section(section)
 
 
 def print_settings():
     """Prints the contents of the settings file"""
-    config = configparser.ConfigParser()
     print("Current environment: ", ENVIRONMENT)
-    config.read(FILENAME)
-    config.write(sys.stdout)
+    backend.load().write(sys.stdout)
 
 
 def get_lang() -> str:
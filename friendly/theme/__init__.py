@@ -1,16 +1,28 @@
 """Syntax colouring based on the availability of pygments
+
+The submodules friendly_pygments and friendly_rich import Pygments and Rich,
+which are slow to import; they are only imported when first needed.
 """
+import importlib
 import sys
 
-from . import friendly_pygments
-from . import friendly_rich
-from . import patch_tb_lexer  # noqa will automatically Monkeypatch
+from . import colours
 from .colours import validate_color
 
+_lazy_submodules = ["friendly_pygments", "friendly_rich", "patch_tb_lexer"]
+
+
+def __getattr__(name):
+    if name in _lazy_submodules:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def init_rich_console(
     style="dark", color_system="auto", force_jupyter=None, background=None
 ):
+    from . import friendly_pygments, friendly_rich
+
     try:
         background = validate_color(background)
     except ValueError as e:
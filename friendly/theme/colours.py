@@ -1,7 +1,11 @@
-from . import friendly_pygments
+import sys
+
 from ..my_gettext import current_lang
 from .. import settings
 
+# friendly_pygments, which imports Pygments, is imported in functions that
+# need it so that importing this module remains fast.
+
 
 def validate_color(color):
     _ = current_lang.translate
@@ -24,7 +28,22 @@ def validate_color(color):
     raise ValueError(_("Invalid color {color}").format(color=color))
 
 
+def _clear_styles_cache():
+    """Styles parsed by friendly_rich depend on the background and highlight."""
+    friendly_rich = sys.modules.get(__package__ + ".friendly_rich")
+    if friendly_rich is not None:
+        friendly_rich.clear_styles_cache()
+
+
 def set_background_color(color):
+    _clear_styles_cache()
+    with settings.transaction():
+        return _set_background_color(color)
+
+
+def _set_background_color(color):
+    from . import friendly_pygments
+
     if color is None:
         color = friendly_pygments.set_pygments_background_color(None)
         settings.write(option="background", value=color)
@@ -42,6 +61,7 @@ def set_background_color(color):
 
 
 def set_highlight(bg="#cc0000", fg="white"):
+    _clear_styles_cache()
     if bg is None or fg is None:
         settings.write(option="highlight", value="use carets")
         return
@@ -60,12 +80,14 @@ def set_highlight(bg="#cc0000", fg="white"):
     settings.write(option="highlight", value=f"{fg} on {bg}")
 
 
-def get_highlight():
+def get_highlight(theme=None):
+    from . import friendly_pygments
+
     highlight = settings.read(option="highlight")
     if highlight == "use carets":
         return None
     elif highlight is None:
-        bg, fg = friendly_pygments.get_pygments_error_token()
+        bg, fg = friendly_pygments.get_pygments_error_token(theme)
         return f"{fg} on {bg}"
     return highlight
 
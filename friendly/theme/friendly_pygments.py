@@ -4,6 +4,8 @@ from pygments import styles
 from pygments.token import Error
 from friendly_styles import friendly_light, friendly_dark
 
+from . import patch_tb_lexer  # noqa will automatically Monkeypatch
+
 # When friendly is imported in environments that have previously
 # imported Pygments, the styles defined in friendly_styles do not
 # get automatically added to the list of available styles from pygments,
@@ -47,8 +49,10 @@ def set_pygments_error_token(bg, fg):
     CURRENT_THEME.styles[Error] = f"bg:{bg} {fg}"
 
 
-def get_pygments_error_token():
-    if CURRENT_THEME == friendly_dark:
+def get_pygments_error_token(theme=None):
+    if theme is None:
+        theme = CURRENT_THEME
+    if theme == friendly_dark:
         colour = default_dark_highlight_colour
     else:
         colour = default_light_highlight_colour
@@ -3,16 +3,27 @@
 All Rich-related imports and redefinitions are done here.
 
 """
+import bisect
 import builtins
+import collections
+import contextlib
+import contextvars
 import inspect
+import threading
+import tokenize as py_tokenize
+import weakref
 
+from .. import time_budget
+from . import friendly_pygments
 from .friendly_pygments import friendly_dark, friendly_light
 from . import colours
 from friendly_traceback.utils import get_highlighting_ranges
 
 import rich
 from rich import pretty
-from rich.markdown import Heading, CodeBlock
+from rich.console import Console
+from rich.markdown import Heading, CodeBlock, Markdown
+from rich.style import Style
 from rich.syntax import Syntax
 from rich.text import Text
 from rich.theme import Theme
@@ -21,26 +32,84 @@ from pygments.token import Comment, Generic, Keyword, Name, Number, Operator, St
 
 from friendly_traceback import token_utils
 
+# Tokens which are ignored when the code is tokenized one line at a time.
+SKIPPED_TOKEN_TYPES = {
+    py_tokenize.NEWLINE,
+    py_tokenize.NL,
+    py_tokenize.INDENT,
+    py_tokenize.DEDENT,
+    py_tokenize.ENDMARKER,
+}
+
 dark_background_theme = Theme(friendly_dark.friendly_style)
 light_background_theme = Theme(friendly_light.friendly_style)
 
 
+# Names of builtin functions and exceptions; computed once, as they are
+# looked up for every token of every highlighted line.
+BUILTIN_FUNCTIONS = frozenset(
+    name for name, obj in vars(builtins).items() if inspect.isbuiltin(obj)
+)
+BUILTIN_EXCEPTIONS = frozenset(
+    name
+    for name, obj in vars(builtins).items()
+    if isinstance(obj, type) and issubclass(obj, BaseException)
+)
+
+
 def is_builtin(string):
-    if string.strip() not in dir(builtins):
-        return False
-    try:
-        return inspect.isbuiltin(eval(string.strip()))
-    except:  # noqa
-        return False
+    return string.strip() in BUILTIN_FUNCTIONS
 
 
 def is_exception(string):
-    if string.strip() not in dir(builtins):
-        return False
-    try:
-        return issubclass(eval(string.strip()), BaseException)
-    except:  # noqa
-        return False
+    return string.strip() in BUILTIN_EXCEPTIONS
+
+
+# Styles used by ColourHighlighter, parsed once for a given theme,
+# background colour and highlight.
+_styles_cache = collections.OrderedDict()
+_styles_lock = threading.Lock()
+STYLES_CACHE_SIZE = 8
+MAX_TOKEN_STYLES = 10_000
+
+
+def get_styles(theme, highlight):
+    """Returns the styles used by ColourHighlighter as a dict of attributes."""
+    key = (id(theme), theme.background_color, highlight)
+    with _styles_lock:
+        if key in _styles_cache:
+            _styles_cache.move_to_end(key)
+            return _styles_cache[key]
+
+    background = theme.background_color
+
+    def on_background(token_type):
+        return Style.parse(f"{theme.styles[token_type]} on {background}")
+
+    styles = {
+        "operator_style": on_background(Operator),
+        "number_style": on_background(Number),
+        "code_style": on_background(Name),
+        "keyword_style": on_background(Keyword),
+        "constant_style": on_background(Keyword.Constant),
+        "comment_style": on_background(Comment),
+        "builtin_style": on_background(Name.Builtin),
+        "exception_style": on_background(Generic.Error),
+        "string_style": on_background(String),
+        "error_style": Style.parse(highlight) if highlight else highlight,
+        "_styles": {},  # (token.type, token.string) -> style
+    }
+    with _styles_lock:
+        _styles_cache[key] = styles
+        if len(_styles_cache) > STYLES_CACHE_SIZE:
+            _styles_cache.popitem(last=False)
+    return styles
+
+
+def clear_styles_cache():
+    """Called when the background colour or the highlight is changed."""
+    with _styles_lock:
+        _styles_cache.clear()
 
 
 class MultilineString:
@@ -64,19 +133,24 @@ class ColourHighlighter:
     of the line above.
     """
 
-    def __init__(self, theme):
+    def __init__(self, theme, highlight=None):
         self.theme = theme
-        background = theme.background_color
-        self.operator_style = f"{theme.styles[Operator]} on {background}"
-        self.number_style = f"{theme.styles[Number]} on {background}"
-        self.code_style = f"{theme.styles[Name]} on {background}"
-        self.keyword_style = f"{theme.styles[Keyword]} on {background}"
-        self.constant_style = f"{theme.styles[Keyword.Constant]} on {background}"
-        self.comment_style = f"{theme.styles[Comment]} on {background}"
-        self.builtin_style = f"{theme.styles[Name.Builtin]} on {background}"
-        self.exception_style = f"{theme.styles[Generic.Error]} on {background}"
-        self.string_style = f"{theme.styles[String]} on {background}"
-        self.error_style = colours.get_highlight()
+        if highlight is None:
+            highlight = colours.get_highlight()
+        styles = get_styles(theme, highlight)
+        self.operator_style = styles["operator_style"]
+        self.number_style = styles["number_style"]
+        self.code_style = styles["code_style"]
+        self.keyword_style = styles["keyword_style"]
+        self.constant_style = styles["constant_style"]
+        self.comment_style = styles["comment_style"]
+        self.builtin_style = styles["builtin_style"]
+        self.exception_style = styles["exception_style"]
+        self.string_style = styles["string_style"]
+        self.error_style = styles["error_style"]
+        # Shared by all the highlighters using the same styles; it can be
+        # cleared by another thread at any time.
+        self._styles = styles["_styles"]
 
     def split_lineno_from_code(self, lines):
         # Also remove lines of markers
@@ -117,10 +191,18 @@ class ColourHighlighter:
             up_shift += 1
         return new_error_lines
 
-    def find_multiline_strings(self):
-        self.multiline_strings = []
+    def tokenize_code(self):
+        """Tokenizes all the code lines at once, and finds the tokens
+        on each line as well as the strings spanning multiple lines."""
         source = "\n".join(self.code_lines)
         tokens = token_utils.tokenize(source)
+        self.find_multiline_strings(tokens)
+        self.index_tokens_by_line(tokens)
+
+    def find_multiline_strings(self, tokens=None):
+        if tokens is None:
+            tokens = token_utils.tokenize("\n".join(self.code_lines))
+        self.multiline_strings = []
         multiline_string = None
         for index, token in enumerate(tokens):
             if multiline_string:
@@ -140,6 +222,78 @@ class ColourHighlighter:
                         multiline_string.begin_col = tokens[index - 1].end_col
             else:
                 multiline_string = None
+        # Multiline strings do not overlap: they are sorted by their first line.
+        self.multiline_begins = [line_.begin_line for line_ in self.multiline_strings]
+
+    def find_multiline_string(self, lineno):
+        """Returns the multiline string, if any, which contains or ends on
+        the line lineno, without starting on it."""
+        index = bisect.bisect_left(self.multiline_begins, lineno) - 1
+        if index >= 0:
+            line_ = self.multiline_strings[index]
+            if lineno <= line_.end_line:
+                return line_
+        return None
+
+    def index_tokens_by_line(self, tokens):
+        """Finds the tokens on each line, as they would be obtained by
+        tokenizing each line separately.
+
+        Lines for which this cannot be done reliably, such as those that are
+        part of a multiline string or that were not tokenized because of an
+        IndentationError, are left out; they will be tokenized on their own.
+        """
+        if tokens and tokens[-1].type != py_tokenize.ENDMARKER:
+            # Tokenizing stopped early; the last tokens may have been
+            # created by token_utils and span the rest of the lines.
+            last_row = tokens[-1].start_row
+            for token in tokens:
+                if token.type == token_utils.UNCLOSED:
+                    last_row = min(last_row, token.start_row)
+                    break
+            tokens = [token for token in tokens if token.end_row < last_row]
+        by_row = collections.defaultdict(list)
+        for token in tokens:
+            if token.type in SKIPPED_TOKEN_TYPES:
+                continue
+            if token.start_row != token.end_row:
+                by_row[token.start_row] = by_row[token.end_row] = None
+            elif token.type == py_tokenize.ERRORTOKEN:
+                # Invalid code might be tokenized differently on its own.
+                by_row[token.start_row] = None
+            elif by_row[token.start_row] is not None:
+                by_row[token.start_row].append(token)
+
+        self.tokens_by_line = {}
+        for lineno, code_line in enumerate(self.code_lines):
+            line_tokens = by_row.get(lineno + 1)
+            if not line_tokens:
+                continue
+            # Rebuild the line from its tokens to make sure none is missing.
+            end_previous = 0
+            rebuilt = []
+            for token in line_tokens:
+                rebuilt.append(" " * (token.start_col - end_previous) + token.string)
+                end_previous = token.end_col
+            if "".join(rebuilt) != code_line or code_line.endswith((" ", "\t")):
+                continue  # token_utils.tokenize() adjusts trailing spaces
+            first = line_tokens[0]
+            if first.start_col and first.type != py_tokenize.COMMENT:
+                # When tokenized on its own, an indented line starts with INDENT
+                indent = code_line[: first.start_col]
+                line_tokens.insert(
+                    0,
+                    token_utils.Token(
+                        (
+                            py_tokenize.INDENT,
+                            indent,
+                            (first.start_row, 0),
+                            (first.start_row, first.start_col),
+                            first.line,
+                        )
+                    ),
+                )
+            self.tokens_by_line[lineno] = line_tokens
 
     def format_lineno_info(self, lineno_marker):
         if "-->" in lineno_marker:
@@ -148,10 +302,11 @@ class ColourHighlighter:
             return text.append(Text(number, style=self.number_style))
         return Text(lineno_marker, style=self.comment_style)
 
-    def format_code_line(self, new_line, code_line, error_line=None):
+    def format_code_line(self, new_line, code_line, error_line=None, tokens=None):
         if not error_line:
             error_line = []
-        tokens = token_utils.tokenize(code_line)
+        if tokens is None:
+            tokens = token_utils.tokenize(code_line)
         if error_line:
             return self.format_code_line_with_error(new_line, tokens, error_line)
         end_previous = 0
@@ -205,41 +360,46 @@ class ColourHighlighter:
     def format_lines(self, lines, error_lines):
         self.split_lineno_from_code(lines)
         error_lines = self.shift_error_lines(error_lines)
-        self.find_multiline_strings()
+        time_budget.check("render")
+        self.tokenize_code()
         lineno = -1
         new_lines = []
         for lineno_marker, code_line in zip(self.lineno_info, self.code_lines):
+            time_budget.check("render")
             lineno += 1
             error_line = error_lines[lineno] if lineno in error_lines else None
             new_line = self.format_lineno_info(lineno_marker)
+            tokens = self.tokens_by_line.get(lineno)
 
             inside_multiline = False
-            for line_ in self.multiline_strings:
-                if line_.begin_line < lineno < line_.end_line:
-                    inside_multiline = True
-                    break
-                elif lineno == line_.end_line:
-                    new_line.append(
-                        Text(code_line[0 : line_.end_col], style=self.string_style)
-                    )
-                    code_line = code_line[line_.end_col :]
-                    if error_line:
-                        new_error_line = []
-                        for (begin, end) in error_line:
-                            new_error_line.append(
-                                (
-                                    max(0, begin - line_.end_col),
-                                    end - line_.end_col,
-                                )
+            line_ = self.find_multiline_string(lineno)
+            if line_ is not None and lineno < line_.end_line:
+                inside_multiline = True
+            elif line_ is not None:
+                new_line.append(
+                    Text(code_line[0 : line_.end_col], style=self.string_style)
+                )
+                code_line = code_line[line_.end_col :]
+                tokens = None
+                if error_line:
+                    new_error_line = []
+                    for (begin, end) in error_line:
+                        new_error_line.append(
+                            (
+                                max(0, begin - line_.end_col),
+                                end - line_.end_col,
                             )
-                        error_line = new_error_line
+                        )
+                    error_line = new_error_line
 
             if inside_multiline:
                 new_line.append(Text(code_line, style=self.string_style))
             elif error_line:
-                new_line = self.format_code_line(new_line, code_line, error_line)
+                new_line = self.format_code_line(
+                    new_line, code_line, error_line, tokens=tokens
+                )
             else:
-                new_line = self.format_code_line(new_line, code_line)
+                new_line = self.format_code_line(new_line, code_line, tokens=tokens)
             new_lines.append(new_line)
         return new_lines
 
@@ -252,6 +412,16 @@ class ColourHighlighter:
 
     def get_style(self, token):
         """Imitating pygment's styling of individual token."""
+        key = token.type, token.string
+        style = self._styles.get(key)
+        if style is None:
+            style = self._find_style(token)
+            if len(self._styles) > MAX_TOKEN_STYLES:
+                self._styles.clear()
+            self._styles[key] = style
+        return style
+
+    def _find_style(self, token):
         text_string = token.string
         if token.is_keyword():
             if text_string in ["True", "False", "None"]:
@@ -274,50 +444,146 @@ class ColourHighlighter:
             return self.code_style
 
 
-def init_console(theme=friendly_dark, color_system="auto", force_jupyter=None):
-    def _patch_heading(self, *_args):
-        """By default, all headings are centered by Rich; I prefer to have
-        them left-justified, except for <h3>
-        """
-        text = self.text
-        text.justify = "left"
-        # Older version of Rich uses 'level' as an attribute.
-        # Maintaining compatibility for now.
-        if (hasattr(self, "level") and self.level == 3) or (
-            hasattr(self, "tag") and self.tag == "h3"
-        ):
-            yield Text("    ") + text
-        else:
-            yield text
+def _patch_heading(self, *_args):
+    """By default, all headings are centered by Rich; I prefer to have
+    them left-justified, except for <h3>
+    """
+    text = self.text
+    text.justify = "left"
+    # Older version of Rich uses 'level' as an attribute.
+    # Maintaining compatibility for now.
+    if (hasattr(self, "level") and self.level == 3) or (
+        hasattr(self, "tag") and self.tag == "h3"
+    ):
+        yield Text("    ") + text
+    else:
+        yield text
 
-    Heading.__rich_console__ = _patch_heading
 
-    def _patch_code_block(self, *_args):
-        if self.lexer_name != "pytb":
-            self.lexer_name = "python"
-
-        code = str(self.text).rstrip()
-        lines = code.split("\n")
-        error_lines = get_highlighting_ranges(lines)
-        # Sometimes, an entire line is the cause of an error and is not
-        # highlighted with carets so that error_lines is an empty dict.
-        if not error_lines:
-            for line in lines:
-                if line.strip().startswith("-->"):
-                    error_lines = {0: tuple()}
-                    break
+# Segments of the code blocks already rendered, shared by the sections
+# rendered within shared_code_blocks(); None outside of it.
+_code_block_memo = contextvars.ContextVar("friendly_code_block_memo", default=None)
 
-        if (
-            colours.get_highlight() is not None  # otherwise, use carets
-            and self.lexer_name == "python"  # do not process pytb
-            and error_lines
-        ):
-            yield from ColourHighlighter(theme).format_lines(lines, error_lines)
-        else:
-            yield Syntax(code, self.lexer_name, theme=theme, word_wrap=True)
 
+@contextlib.contextmanager
+def shared_code_blocks():
+    """Within this context, a code block appearing in more than one Markdown
+    text, such as the source of the line where an exception was raised,
+    is highlighted only once for a given width."""
+    token = _code_block_memo.set({})
+    try:
+        yield
+    finally:
+        _code_block_memo.reset(token)
+
+
+def _patch_code_block(self, console, options):
+    theme = get_console_theme(console)
+    if self.lexer_name != "pytb":
+        self.lexer_name = "python"
+
+    code = str(self.text).rstrip()
+    highlight = colours.get_highlight(theme)
+    memo = _code_block_memo.get()
+    if memo is None:
+        yield from _code_block_renderables(code, self.lexer_name, theme, highlight)
+        return
+    key = (
+        code,
+        self.lexer_name,
+        id(theme),
+        highlight,
+        options.max_width,
+        options.justify,
+        options.overflow,
+        options.no_wrap,
+    )
+    if key not in memo:
+        memo[key] = [
+            segment
+            for renderable in _code_block_renderables(
+                code, self.lexer_name, theme, highlight
+            )
+            for segment in console.render(renderable, options)
+        ]
+    yield from memo[key]
+
+
+def _code_block_renderables(code, lexer_name, theme, highlight):
+    """Yields the highlighted lines of a code block."""
+    lines = code.split("\n")
+    error_lines = get_highlighting_ranges(lines)
+    # Sometimes, an entire line is the cause of an error and is not
+    # highlighted with carets so that error_lines is an empty dict.
+    if not error_lines:
+        for line in lines:
+            if line.strip().startswith("-->"):
+                error_lines = {0: tuple()}
+                break
+
+    if (
+        highlight is not None  # otherwise, use carets
+        and lexer_name == "python"  # do not process pytb
+        and error_lines
+    ):
+        highlighter = ColourHighlighter(theme, highlight)
+        for line in highlighter.format_lines(lines, error_lines):
+            time_budget.check("render")
+            yield line
+    else:
+        time_budget.check("render")
+        yield Syntax(code, lexer_name, theme=theme, word_wrap=True)
+
+
+class FriendlyHeading(Heading):
+    __rich_console__ = _patch_heading
+
+
+class FriendlyCodeBlock(CodeBlock):
+    __rich_console__ = _patch_code_block
+
+
+class FriendlyMarkdown(Markdown):
+    """Markdown displaying headings and code blocks as friendly does,
+    without changing how Rich displays other Markdown texts."""
+
+    elements = {
+        name: {Heading: FriendlyHeading, CodeBlock: FriendlyCodeBlock}.get(
+            element, element
+        )
+        for name, element in Markdown.elements.items()
+    }
+
+
+def patch_markdown():
+    """Changes how Rich displays headings and code blocks in all Markdown
+    texts; only done by init_console(), for the global console used by
+    set_formatter(), which can also display Markdown texts from users."""
+    Heading.__rich_console__ = _patch_heading
     CodeBlock.__rich_console__ = _patch_code_block
 
+
+# Pygments theme used to display code blocks with a given console.
+_console_themes = weakref.WeakKeyDictionary()
+
+
+def get_console_theme(console):
+    return _console_themes.get(console, friendly_pygments.CURRENT_THEME)
+
+
+def new_console(theme=friendly_dark, **kwargs):
+    """Creates a console, independent of the global one used by Rich,
+    using the given Pygments theme."""
+    if theme == friendly_light:
+        console = Console(theme=light_background_theme, **kwargs)
+    else:
+        console = Console(theme=dark_background_theme, **kwargs)
+    _console_themes[console] = theme
+    return console
+
+
+def init_console(theme=friendly_dark, color_system="auto", force_jupyter=None):
+    patch_markdown()
     if theme == friendly_light:
         rich.reconfigure(
             theme=light_background_theme,
@@ -331,5 +597,6 @@ def init_console(theme=friendly_dark, color_system="auto", force_jupyter=None):
             force_jupyter=force_jupyter,
         )
     console = rich.get_console()
+    _console_themes[console] = theme
     pretty.install(console=console, indent_guides=True)
     return console
@@ -0,0 +1,152 @@
+"""Time budget for formatting the explanation of an exception.
+
+Some exceptions take a very long time to format, for example when the
+source shown is very long or when a variable has a huge repr. When a
+budget is set with set_time_budget(), the formatter set by
+set_formatter() is wrapped by a TimeBudget. The stages of the
+formatting (creating the Markdown text, rendering it with Rich, and the
+IDLE formatter) call check() regularly; when the budget is exceeded,
+the explanation is abandoned and replaced by the Python traceback,
+or by the error message if the traceback is not available.
+
+This is cooperative: a single operation taking longer than the budget,
+such as computing a repr or tokenizing a long code block, is not
+interrupted, but nothing more is done afterwards. Each time the output
+is replaced, this is recorded and can be retrieved with get_degraded().
+"""
+import collections
+import contextlib
+import contextvars
+import time
+from typing import Deque, Dict, Iterator, List, Optional, Union
+
+from friendly_traceback import base_formatters
+from friendly_traceback.config import session
+from friendly_traceback.typing_info import Formatter, InclusionChoice, Info
+
+from .my_gettext import current_lang
+
+_budget = None  # not a constant; seconds
+# Most recent records of the exceptions for which the budget was exceeded.
+_degraded: "Deque[Dict[str, object]]" = collections.deque(maxlen=100)
+_current: "contextvars.ContextVar[Optional[FormattingBudget]]" = (
+    contextvars.ContextVar("friendly_time_budget", default=None)
+)
+
+
+class BudgetExceeded(Exception):
+    """Raised by check() when the time budget is exceeded."""
+
+    def __init__(self, stage: str) -> None:
+        super().__init__(stage)
+        self.stage = stage
+
+
+class FormattingBudget:
+    """Formatting of an exception within the budget of a TimeBudget."""
+
+    __slots__ = ["deadline", "start", "info"]
+
+    def __init__(self, deadline: float, start: float, info: Info) -> None:
+        self.deadline = deadline
+        self.start = start
+        self.info = info
+
+
+def check(stage: str) -> None:
+    """Raises BudgetExceeded if the time budget of the exception being
+    formatted, if any, is exceeded."""
+    current = _current.get()
+    if current is not None and time.perf_counter() > current.deadline:
+        raise BudgetExceeded(stage)
+
+
+class TimeBudget:
+    """Formatter wrapping another one; see the module docstring."""
+
+    def __init__(self, formatter: Formatter, budget: float) -> None:
+        self.formatter = formatter
+        self.budget = budget
+
+    def __call__(self, info: Info, include: InclusionChoice = "explain") -> str:
+        from . import rich_formatters
+
+        start = time.perf_counter()
+        formatting = FormattingBudget(start + self.budget, start, info)
+        try:
+            with applied(formatting):
+                result = self.formatter(info, include=include)
+        except BudgetExceeded as e:
+            rich_formatters._render_state.set(rich_formatters.RenderState(plain=True))
+            return fallback(formatting, e.stage)
+        # The text returned is rendered by rich_writer within the same budget.
+        state = rich_formatters._render_state.get()
+        rich_formatters._render_state.set(state._replace(budget=formatting))
+        return result
+
+
+@contextlib.contextmanager
+def applied(formatting: Optional[FormattingBudget]) -> Iterator[None]:
+    """Context manager within which check() uses the budget of formatting,
+    which can be None."""
+    token = _current.set(formatting)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def fallback(formatting: FormattingBudget, stage: str) -> str:
+    """Records that the budget was exceeded during stage, and returns
+    the output shown instead of the explanation."""
+    from . import rich_formatters
+
+    info = formatting.info
+    _degraded.append(
+        {
+            "exception": rich_formatters.exception_name(info),
+            "stage": stage,
+            "elapsed": time.perf_counter() - formatting.start,
+        }
+    )
+    _ = current_lang.translate
+    # Same as include="python_tb"
+    text = (
+        info.get("simulated_python_traceback")
+        or info.get("original_python_traceback")
+        or info.get("message", "")
+    )
+    note = _("(explanation skipped: formatting took too long)")
+    return text.rstrip("\n") + "\n" + note + "\n"
+
+
+def get_degraded() -> List[Dict[str, object]]:
+    """Returns a list of the most recent exceptions for which the budget
+    was exceeded, as dicts with the exception name, the stage during which
+    this happened and the time elapsed, in seconds."""
+    return list(_degraded)
+
+
+def wrap(formatter: Union[Formatter, str, None]) -> Union[Formatter, str, None]:
+    """Returns the formatter, wrapped by a TimeBudget if a budget is set."""
+    if isinstance(formatter, TimeBudget):
+        formatter = formatter.formatter
+    if _budget is None:
+        return formatter
+    if formatter is None or formatter == "repl":
+        formatter = base_formatters.repl
+    elif formatter == "docs":
+        formatter = base_formatters.docs
+    elif isinstance(formatter, str):
+        return formatter  # Unknown; reported by friendly_traceback
+    return TimeBudget(formatter, _budget)
+
+
+def set_time_budget(seconds: Optional[float] = None) -> None:
+    """Sets the maximum time, in seconds, spent formatting the explanation
+    of an exception, for the current formatter and those set afterwards.
+    When it is exceeded, the Python traceback is shown instead.
+    Use None to remove the limit. See the module docstring for details."""
+    global _budget
+    _budget = seconds
+    session.set_formatter(wrap(session.formatter))
@@ -0,0 +1,50 @@
+"""Number of bytes written to a terminal, or a log file, for a corpus
+of tracebacks, with the ANSI codes written by Rich and with those
+written when use_minimal_ansi() is used.
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_ansi_size.py --color-system 256
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_markdown import get_infos  # noqa: E402
+import friendly  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--color-system", default="truecolor", choices=["standard", "256", "truecolor"]
+    )
+    args = parser.parse_args()
+
+    sizes = {"ansi": 0, "minimal_ansi": 0}
+    count = 0
+    for info in get_infos():
+        for formatter in ["dark", "light"]:
+            for include in ["explain", "friendly_tb", "where", "why"]:
+                count += 1
+                for output in sizes:
+                    text = friendly.render(
+                        info,
+                        formatter=formatter,
+                        include=include,
+                        color_system=args.color_system,
+                        output=output,
+                    )
+                    sizes[output] += len(text.encode("utf-8"))
+
+    print(f"tracebacks: {count}, color system: {args.color_system}")
+    for output, size in sizes.items():
+        print(f"{output + ':':14} {size / 1024:8.1f} kB")
+    print(f"reduction:     {1 - sizes['minimal_ansi'] / sizes['ansi']:8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Time needed to write the explanation of a corpus of exceptions to a
+terminal, without the disk cache, with an empty disk cache and with a
+disk cache filled by a previous run.
+
+The in-memory render cache is cleared before each exception, as it
+would be empty in a new process.
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_disk_cache.py --repeat 5
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_markdown import get_infos  # noqa: E402
+from friendly import disk_cache, rich_formatters  # noqa: E402
+from friendly.theme import friendly_rich  # noqa: E402
+from friendly_traceback.config import session  # noqa: E402
+
+
+def measure(texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            rich_formatters.render_cache.clear()
+            rich_formatters.rich_writer(text)
+    return (time.perf_counter() - start) / (repeat * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    session.console = friendly_rich.new_console(
+        file=io.StringIO(), force_terminal=True, color_system="truecolor", width=80
+    )
+    session.rich_add_vspace = False
+    texts = [rich_formatters._rich_markdown(info, "explain") for info in get_infos()]
+    rich_formatters._take_render_state()  # set by _rich_markdown()
+
+    disk_cache.disable()
+    default = measure(texts, args.repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        disk_cache.enable(directory)
+        cold = measure(texts, 1)
+        warm = measure(texts, args.repeat)
+        size = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory)
+        )
+        disk_cache.disable()
+    print(f"exceptions: {len(texts)}, cache directory: {size / 1024:.1f} kB")
+    print(f"no disk cache:    {default * 1000:7.2f} ms per exception")
+    print(f"empty disk cache: {cold * 1000:7.2f} ms per exception")
+    print(f"filled cache:     {warm * 1000:7.2f} ms per exception")
+    print(f"reduction:        {1 - warm / default:7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Throughput of the text formatters: json_lines, markdown and markdown_docs,
+for a corpus of exceptions and every include value.
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_formatters.py --repeat 100
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_markdown import get_infos  # noqa: E402
+from friendly_traceback.base_formatters import items_groups  # noqa: E402
+from friendly import rich_formatters  # noqa: E402
+
+FORMATTERS = ["json_lines", "markdown", "markdown_docs"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    infos = get_infos()
+    includes = list(items_groups)
+    print(f"infos: {len(infos)}, includes: {len(includes)}, repeat: {args.repeat}")
+    for name in FORMATTERS:
+        formatter = getattr(rich_formatters, name)
+        size = 0
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for info in infos:
+                for include in includes:
+                    size += len(formatter(info, include))
+        elapsed = time.perf_counter() - start
+        calls = args.repeat * len(infos) * len(includes)
+        print(
+            f"{name + ':':15} {calls / elapsed:10.0f} tracebacks/s"
+            f"  {size / elapsed / 2**20:7.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
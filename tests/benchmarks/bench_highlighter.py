@@ -0,0 +1,90 @@
+"""Micro-benchmark of the syntax colouring done by ColourHighlighter.
+
+A 200-line code block, formatted as it would be by friendly_traceback,
+is highlighted repeatedly. We report the time needed to format the whole
+block as well as the average cost of choosing the style of a single token.
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_highlighter.py --repeat 20
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("FRIENDLY_SETTINGS", "memory")
+
+from friendly_traceback import token_utils  # noqa: E402
+from friendly_traceback.utils import get_highlighting_ranges  # noqa: E402
+from friendly.theme import friendly_pygments, friendly_rich  # noqa: E402
+
+TEMPLATE = [
+    "def process_{n}(items, limit=10):",
+    '    """Docstring of process_{n},',
+    '    spanning two lines."""',
+    "    # Keep only the values we can convert",
+    "    result = [int(x) for x in items if isinstance(x, str)]",
+    "    if len(result) > limit or not result:",
+    "        raise ValueError(f'Too many items: {{len(result)}}')",
+    "    try:",
+    "        total = sum(result) / max(result) * 3.14",
+    "    except ZeroDivisionError:",
+    "        total = None",
+    "    return sorted(set(result)), total, 'done'",
+]
+
+
+def make_code_block(nb_lines=200):
+    """Returns lines numbered like those shown by friendly_traceback,
+    with the error in the middle, and the error ranges."""
+    lines = []
+    for n in range(nb_lines):
+        code = TEMPLATE[n % len(TEMPLATE)].format(n=n)
+        lines.append(f"      {n + 1:>3}| {code}")
+    # The error is on a line with  total = sum(...), near the middle.
+    error_index = [n for n, line in enumerate(TEMPLATE) if "total = sum" in line][0]
+    middle = nb_lines // 2
+    middle += (error_index - middle) % len(TEMPLATE)
+    lines[middle] = "   -->" + lines[middle][6:]
+    lines.insert(middle + 1, " " * 27 + "^^^^^^^^^^^")
+    return lines, get_highlighting_ranges(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=200)
+    args = parser.parse_args()
+
+    lines, error_lines = make_code_block(args.lines)
+    theme = friendly_pygments.friendly_dark
+    tokens = [
+        token
+        for line in lines
+        for token in token_utils.tokenize(line.split("|", 1)[-1])
+        if token.string.strip()
+    ]
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        highlighter = friendly_rich.ColourHighlighter(theme)
+        highlighter.format_lines(lines, error_lines)
+    block_time = (time.perf_counter() - start) / args.repeat
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        highlighter = friendly_rich.ColourHighlighter(theme)
+        for token in tokens:
+            highlighter.get_style(token)
+    style_time = (time.perf_counter() - start) / args.repeat
+
+    print(f"lines: {len(lines)}, tokens: {len(tokens)}, repeat: {args.repeat}")
+    print(f"format_lines: {block_time * 1000:.2f} ms per code block")
+    print(f"get_style:    {style_time / len(tokens) * 1e6:.2f} us per token")
+
+
+if __name__ == "__main__":
+    main()
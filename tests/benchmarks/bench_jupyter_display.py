@@ -0,0 +1,112 @@
+"""Number of display messages and time needed to show an exception
+with the interactive Jupyter formatter.
+
+By default, IPython's display() is replaced by a function counting the
+number of calls, each of which would be a separate message sent by the
+kernel to the notebook. With --kernel, a local IPython kernel is started
+(this requires jupyter_client and ipykernel) and the display_data messages
+received on the IOPub channel are counted.
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_jupyter_display.py --repeat 20
+    python tests/benchmarks/bench_jupyter_display.py --kernel
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+SETUP = """
+import os, sys
+os.environ["FRIENDLY_SETTINGS"] = "memory"
+sys.path.insert(0, {root!r})
+import friendly, friendly_traceback
+friendly.set_formatter("interactive-dark", force_jupyter=True)
+friendly_traceback.set_include("friendly_tb")
+
+def inner(d):
+    return d["b"]
+
+def middle(d):
+    return inner(d)
+
+def outer():
+    return middle({{"a": 1}})
+"""
+
+RAISE = """
+try:
+    outer()
+except Exception:
+    friendly_traceback.explain_traceback()
+"""
+
+
+def run_in_process(repeat):
+    import IPython.display
+
+    calls = []
+    original_display = IPython.display.display
+    IPython.display.display = lambda *objs, **kwargs: calls.extend(objs)
+    namespace = {}
+    try:
+        exec(SETUP.format(root=ROOT), namespace)
+        exec(RAISE, namespace)  # warm up
+        times = []
+        counts = []
+        for _ in range(repeat):
+            calls.clear()
+            start = time.perf_counter()
+            exec(RAISE, namespace)
+            times.append(time.perf_counter() - start)
+            counts.append(len(calls))
+    finally:
+        IPython.display.display = original_display
+    return times, counts
+
+
+def run_in_kernel(repeat):
+    from jupyter_client.manager import start_new_kernel
+
+    km, kc = start_new_kernel()
+    try:
+        kc.execute_interactive(SETUP.format(root=ROOT), timeout=60)
+        kc.execute_interactive(RAISE, timeout=60)  # warm up
+        times = []
+        counts = []
+        for _ in range(repeat):
+            messages = []
+            start = time.perf_counter()
+            kc.execute_interactive(RAISE, timeout=60, output_hook=messages.append)
+            times.append(time.perf_counter() - start)
+            counts.append(
+                sum(1 for msg in messages if msg["msg_type"] == "display_data")
+            )
+    finally:
+        kc.stop_channels()
+        km.shutdown_kernel(now=True)
+    return times, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--kernel", action="store_true", help="Use a local IPython kernel."
+    )
+    args = parser.parse_args()
+
+    if args.kernel:
+        times, counts = run_in_kernel(args.repeat)
+    else:
+        times, counts = run_in_process(args.repeat)
+    print(f"display messages per exception: {statistics.median(counts)}")
+    print(f"time per exception: {statistics.median(times) * 1000:.2f} ms (median)")
+
+
+if __name__ == "__main__":
+    main()
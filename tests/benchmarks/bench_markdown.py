@@ -0,0 +1,76 @@
+"""Time needed by _markdown() to convert the information about a traceback
+into Markdown text, for a corpus of exceptions and every include value.
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_markdown.py --repeat 200
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("FRIENDLY_SETTINGS", "memory")
+
+from friendly_traceback.base_formatters import items_groups  # noqa: E402
+from friendly_traceback.core import FriendlyTraceback  # noqa: E402
+from friendly import rich_formatters  # noqa: E402
+
+CORPUS = [
+    "{'a': 1}['b']",
+    "1 / 0",
+    "undefined_name",
+    "'a' + 1",
+    "[1, 2][5]",
+    "int('x')",
+    "None.upper()",
+    "len(5)",
+    "import not_a_module",
+    "exec('def f(:\\n    pass')",
+    "exec('if True:\\nprint(1)')",
+    "exec('a = (1,\\n     2')",
+]
+
+
+def get_infos():
+    infos = []
+    for code in CORPUS:
+        try:
+            exec(code, {})
+        except Exception as e:  # noqa
+            friendly_tb = FriendlyTraceback(type(e), e, e.__traceback__)
+            friendly_tb.compile_info()
+            infos.append(friendly_tb.info)
+    return infos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    infos = get_infos()
+    includes = list(items_groups)
+    options = [
+        {"rich": False, "documentation": False},
+        {"rich": True, "documentation": False},
+        {"rich": False, "documentation": True},
+    ]
+    calls = 0
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for info in infos:
+            for include in includes:
+                for kwargs in options:
+                    rich_formatters._markdown(info, include, **kwargs)
+                    calls += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"infos: {len(infos)}, includes: {len(includes)}, calls: {calls}")
+    print(f"_markdown: {elapsed / calls * 1e6:.2f} us per call")
+
+
+if __name__ == "__main__":
+    main()
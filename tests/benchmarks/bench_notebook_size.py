@@ -0,0 +1,121 @@
+"""Size of a notebook containing many interactive tracebacks.
+
+The HTML sent by the interactive Jupyter formatter for each traceback is
+saved as the output of a separate cell of a notebook (nbformat 4),
+written as Jupyter would, with and without use_shared_script() and
+use_css_classes().
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_notebook_size.py --tracebacks 100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# Run in a separate process for each mode: the shared script and the
+# style sheet are only sent once per session.
+CODE = """
+import json, os, sys
+os.environ["FRIENDLY_SETTINGS"] = "memory"
+sys.path.insert(0, {root!r})
+import IPython.display
+payloads = []
+IPython.display.display = lambda *objs, **kwargs: payloads.extend(
+    obj.data for obj in objs
+)
+import friendly, friendly_traceback
+from friendly import rich_formatters
+friendly.set_formatter("interactive-dark", force_jupyter=True)
+friendly_traceback.set_include("friendly_tb")
+rich_formatters.use_shared_script({shared})
+rich_formatters.use_css_classes({css_classes})
+
+def inner(d, key):
+    return d[key]
+
+def outer(key):
+    return inner({{"a": 1}}, key)
+
+cells = []
+for n in range({tracebacks}):
+    payloads.clear()
+    try:
+        outer("b%d" % n)
+    except Exception:
+        friendly_traceback.explain_traceback()
+    cells.append(payloads[:])
+print(json.dumps(cells))
+"""
+
+
+def make_notebook(cells):
+    """Returns a notebook, in nbformat 4, with one cell per traceback."""
+    notebook_cells = []
+    for n, payloads in enumerate(cells):
+        outputs = [
+            {
+                "data": {
+                    "text/html": html.splitlines(keepends=True),
+                    "text/plain": ["<IPython.core.display.HTML object>"],
+                },
+                "metadata": {},
+                "output_type": "display_data",
+            }
+            for html in payloads
+        ]
+        notebook_cells.append(
+            {
+                "cell_type": "code",
+                "execution_count": n + 1,
+                "metadata": {},
+                "outputs": outputs,
+                "source": [f'outer("b{n}")'],
+            }
+        )
+    return {
+        "cells": notebook_cells,
+        "metadata": {},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    }
+
+
+def notebook_size(tracebacks, shared=False, css_classes=False):
+    code = CODE.format(
+        root=ROOT, tracebacks=tracebacks, shared=shared, css_classes=css_classes
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    cells = json.loads(process.stdout.splitlines()[-1])
+    notebook = json.dumps(make_notebook(cells), indent=1, ensure_ascii=False)
+    return len(notebook.encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tracebacks", type=int, default=100)
+    args = parser.parse_args()
+
+    default = notebook_size(args.tracebacks)
+    print(f"tracebacks: {args.tracebacks}")
+    print(f"default:         {default / 1024:10.1f} kB")
+    for label, options in [
+        ("shared script", {"shared": True}),
+        ("css classes", {"css_classes": True}),
+        ("both", {"shared": True, "css_classes": True}),
+    ]:
+        size = notebook_size(args.tracebacks, **options)
+        print(f"{label + ':':16} {size / 1024:10.1f} kB  ({1 - size / default:.1%} smaller)")
+
+
+if __name__ == "__main__":
+    main()
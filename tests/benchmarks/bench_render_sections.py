@@ -0,0 +1,63 @@
+"""Time needed to render all the sections shown by interactive front ends
+(message, friendly_tb, what, why, where, detailed_tb) for a corpus of
+exceptions, with a render() call per section and with render_sections().
+
+The render cache is cleared before each exception so that every section
+is rendered by Rich.
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_render_sections.py --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_markdown import get_infos  # noqa: E402
+from friendly import rich_formatters  # noqa: E402
+
+
+def separate_renders(info, output):
+    return {
+        section: rich_formatters.render(info, include=section, output=output)
+        for section in rich_formatters.SECTIONS
+    }
+
+
+def shared_render(info, output):
+    return rich_formatters.render_sections(info, output=output)
+
+
+def measure(function, infos, output, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for info in infos:
+            rich_formatters.render_cache.clear()
+            function(info, output)
+    return (time.perf_counter() - start) / (repeat * len(infos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--output", default="ansi", choices=["ansi", "minimal_ansi", "html", "text"]
+    )
+    args = parser.parse_args()
+
+    infos = get_infos()
+    shared_render(infos[0], args.output)  # warm up
+    separate = measure(separate_renders, infos, args.output, args.repeat)
+    shared = measure(shared_render, infos, args.output, args.repeat)
+    print(f"exceptions: {len(infos)}, sections: {len(rich_formatters.SECTIONS)}")
+    print(f"render() per section: {separate * 1000:7.2f} ms per exception")
+    print(f"render_sections():    {shared * 1000:7.2f} ms per exception")
+    print(f"reduction:            {1 - shared / separate:7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Stress test of the settings file shared by many processes.
+
+Each process writes its own set of keys to the same settings file, reading
+each one back after writing it. At the end, we count how many of the values
+written are missing from the file (lost updates).
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_settings_stress.py --processes 16 --writes 50
+    python tests/benchmarks/bench_settings_stress.py --unlocked  # for comparison
+"""
+import argparse
+import configparser
+import contextlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+SECTION = "stress"
+
+
+def worker(filename, index, writes, unlocked, barrier, results):
+    sys.path.insert(0, ROOT)
+    from friendly import settings
+
+    settings.set_backend(settings.FileBackend(filename))
+    settings.ENVIRONMENT = SECTION
+    if unlocked:
+        settings.FileBackend._lock = lambda self: contextlib.nullcontext()
+    barrier.wait()  # all processes have imported friendly
+    start = time.perf_counter()
+    errors = 0
+    for n in range(writes):
+        try:
+            settings.write(option=f"p{index}_{n}", value=str(n))
+            settings.read(option=f"p{index}_{n}")
+        except Exception:  # noqa
+            errors += 1  # typically, reading a partially written file
+    results.put((time.perf_counter() - start, errors))
+
+
+def run(processes, writes, unlocked):
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "friendly.ini")
+        open(filename, "w").close()
+        barrier = ctx.Barrier(processes + 1)
+        results = ctx.Queue()
+        workers = [
+            ctx.Process(
+                target=worker,
+                args=(filename, index, writes, unlocked, barrier, results),
+            )
+            for index in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        barrier.wait()
+        start = time.perf_counter()
+        durations, errors = zip(*[results.get() for _ in workers])
+        elapsed = time.perf_counter() - start
+        for process in workers:
+            process.join()
+
+        config = configparser.ConfigParser()
+        try:
+            config.read(filename)
+            saved = config[SECTION] if SECTION in config else {}
+            corrupted = False
+        except configparser.Error:
+            saved = {}
+            corrupted = True
+        expected = processes * writes
+        lost = sum(
+            1
+            for index in range(processes)
+            for n in range(writes)
+            if saved.get(f"p{index}_{n}") != str(n)
+        )
+    return {
+        "processes": processes,
+        "writes_per_process": writes,
+        "locked": not unlocked,
+        "elapsed": elapsed,
+        "slowest_process": max(durations),
+        "writes_per_second": expected / elapsed,
+        "lost_updates": lost,
+        "errors": sum(errors),
+        "corrupted": corrupted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--processes", type=int, default=16)
+    parser.add_argument("--writes", type=int, default=50)
+    parser.add_argument(
+        "--unlocked", action="store_true", help="Disable the advisory file lock."
+    )
+    args = parser.parse_args()
+    result = run(args.processes, args.writes, args.unlocked)
+    for key, value in result.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        print(f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Cold start benchmark for all the entry points of friendly.
+
+Each entry point is run several times, every time in a fresh Python
+subprocess. For each, we record the wall time, the peak resident memory
+and the modules that took the most time to import, as reported by
+``python -X importtime``.
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_startup.py --output startup.json
+    # ... make some changes, then
+    python tests/benchmarks/bench_startup.py --compare startup.json
+
+When comparing, the exit code is 1 if the median wall time of any entry
+point is more than ``--tolerance`` (default: 20%) slower than the
+previous result, so that this can be used to catch startup regressions
+before a release.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# Run in the subprocess before the code being measured.
+# The peak memory use is written to a file when the process exits.
+PRELUDE = """
+import atexit, os, sys
+
+def _report_memory():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    with open(os.environ["FRIENDLY_BENCH_RSS_FILE"], "w") as f:
+        f.write(str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+atexit.register(_report_memory)
+"""
+
+# IDLE's shell is normally available as sys.stdout.shell in the process
+# running the user's code, and source lines are retrieved from it through
+# idlelib.rpc. Neither is available outside of IDLE.
+IDLE_STUB = """
+from idlelib import rpc
+
+class _Shell:
+    def write(self, text, tag=None):
+        sys.__stdout__.write(text)
+
+    def flush(self):
+        sys.__stdout__.flush()
+
+class _RpcHandler:
+    def remotecall(self, *args):
+        return []
+
+class _Executive:
+    rpchandler = _RpcHandler()
+
+sys.stdout.shell = _Shell()
+rpc.objecttable["exec"] = _Executive()
+"""
+
+ENTRY_POINTS = {
+    "import friendly": "import friendly",
+    "python -m friendly --version": (
+        "import runpy\n"
+        "sys.argv = ['friendly', '--version']\n"
+        "runpy.run_module('friendly', run_name='__main__', alter_sys=True)"
+    ),
+    "import friendly.ipython": "import friendly.ipython",
+    "import friendly.jupyter": "import friendly.jupyter",
+    "import friendly.idle": IDLE_STUB + "import friendly.idle",
+    "import friendly.mu": "import friendly.mu",
+}
+
+
+def parse_importtime(stderr, top=10):
+    """Returns the modules with the largest self import time, in ms."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:") :].split("|")
+        modules.append(
+            {
+                "module": name.strip(),
+                "self_ms": int(self_time) / 1000,
+                "cumulative_ms": int(cumulative) / 1000,
+            }
+        )
+    modules.sort(key=lambda module: module["self_ms"], reverse=True)
+    return modules[:top]
+
+
+def run_once(code, settings):
+    """Runs code in a new process; returns its wall time, peak memory and stderr."""
+    with tempfile.TemporaryDirectory() as directory:
+        rss_file = os.path.join(directory, "rss")
+        env = dict(os.environ, FRIENDLY_BENCH_RSS_FILE=rss_file)
+        if settings is not None:
+            env["FRIENDLY_SETTINGS"] = settings
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PRELUDE + code],
+            cwd=ROOT,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        wall_time = time.perf_counter() - start
+        max_rss = None
+        if os.path.exists(rss_file):
+            with open(rss_file) as f:
+                max_rss = int(f.read())
+            if sys.platform == "darwin":  # bytes instead of kilobytes
+                max_rss //= 1024
+    if process.returncode not in (0, None):
+        error = [
+            line
+            for line in process.stderr.splitlines()
+            if not line.startswith("import time:")
+        ]
+        raise RuntimeError(f"Failed to run: {code!r}\n" + "\n".join(error[-5:]))
+    return wall_time, max_rss, process.stderr
+
+
+def measure(entry_points, repeat, settings):
+    results = {}
+    for name, code in entry_points.items():
+        wall_times = []
+        max_rss = []
+        stderr = ""
+        for _ in range(repeat):
+            wall_time, rss, stderr = run_once(code, settings)
+            wall_times.append(wall_time * 1000)
+            if rss is not None:
+                max_rss.append(rss)
+        results[name] = {
+            "wall_ms": statistics.median(wall_times),
+            "wall_ms_runs": [round(t, 2) for t in wall_times],
+            "max_rss_kb": max(max_rss) if max_rss else None,
+            "top_modules": parse_importtime(stderr),
+        }
+    return results
+
+
+def compare(previous, current, tolerance):
+    """Prints a comparison table and returns True if there is a regression."""
+    regression = False
+    print(f"{'entry point':<32} {'before':>10} {'after':>10} {'ratio':>7}")
+    for name, result in current.items():
+        if name not in previous:
+            print(f"{name:<32} {'-':>10} {result['wall_ms']:>8.1f}ms")
+            continue
+        before = previous[name]["wall_ms"]
+        after = result["wall_ms"]
+        ratio = after / before
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  <-- regression"
+            regression = True
+        print(f"{name:<32} {before:>8.1f}ms {after:>8.1f}ms {ratio:>7.2f}{flag}")
+    return regression
+
+
+def print_results(results):
+    print(f"{'entry point':<32} {'wall':>10} {'max rss':>10}  slowest import")
+    for name, result in results.items():
+        rss = result["max_rss_kb"]
+        rss = f"{rss / 1024:.1f}MB" if rss is not None else "-"
+        slowest = result["top_modules"][0]["module"] if result["top_modules"] else ""
+        print(f"{name:<32} {result['wall_ms']:>8.1f}ms {rss:>10}  {slowest}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Save the results in this JSON file.")
+    parser.add_argument("--compare", help="JSON file with previous results.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--settings",
+        default="memory",
+        help="Value of FRIENDLY_SETTINGS; 'memory' avoids modifying saved settings.",
+    )
+    parser.add_argument(
+        "--only", action="append", help="Only measure the given entry point(s)."
+    )
+    args = parser.parse_args()
+
+    entry_points = ENTRY_POINTS
+    if args.only:
+        entry_points = {name: ENTRY_POINTS[name] for name in args.only}
+    results = measure(entry_points, args.repeat, args.settings)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "repeat": args.repeat,
+                    "entry_points": results,
+                },
+                f,
+                indent=2,
+            )
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["entry_points"]
+        print()
+        if compare(previous, results, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
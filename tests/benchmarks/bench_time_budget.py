@@ -0,0 +1,59 @@
+"""Time needed to format and write the explanation of an exception whose
+source is very long, with and without a time budget.
+
+Usage, from the root of the repository::
+
+    python tests/benchmarks/bench_time_budget.py --lines 5000 --budget 0.05
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_markdown import get_infos  # noqa: E402
+from friendly import rich_formatters, time_budget  # noqa: E402
+from friendly.theme import friendly_rich  # noqa: E402
+from friendly_traceback.config import session  # noqa: E402
+
+
+def measure(formatter, info, repeat):
+    worst = 0
+    for _ in range(repeat):
+        rich_formatters.render_cache.clear()
+        start = time.perf_counter()
+        rich_formatters.rich_writer(formatter(info, include="explain"))
+        worst = max(worst, time.perf_counter() - start)
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--budget", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    session.console = friendly_rich.new_console(file=io.StringIO(), width=80)
+    session.rich_add_vspace = False
+    info = dict(get_infos()[0])
+    # The last line is shown as the one where the exception was raised.
+    info["exception_raised_source"] = "".join(
+        f"{n:6}| x_{n} = some_function(x_{n - 1}, 'text')\n"
+        for n in range(1, args.lines)
+    ) + f"  -->{args.lines}| y = x_{args.lines - 1}['key']\n"
+
+    default = measure(rich_formatters.rich_markdown, info, args.repeat)
+    budget = time_budget.TimeBudget(rich_formatters.rich_markdown, args.budget)
+    limited = measure(budget, info, args.repeat)
+    print(f"source lines: {args.lines}, budget: {args.budget * 1000:.0f} ms")
+    print(f"no budget:   {default * 1000:8.1f} ms (worst case)")
+    print(f"with budget: {limited * 1000:8.1f} ms (worst case)")
+    print(f"degraded:    {len(time_budget.get_degraded())} of {args.repeat}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import pytest
+
+
+def _get_info(key="b"):
+    from friendly_traceback.core import FriendlyTraceback
+
+    def inner(d):
+        return d[key]
+
+    try:
+        inner({"a": 1})
+    except KeyError as e:
+        friendly_tb = FriendlyTraceback(type(e), e, e.__traceback__)
+        friendly_tb.compile_info()
+        return friendly_tb.info
+
+
+@pytest.fixture
+def get_info():
+    """Function returning the information about the KeyError raised
+    for its argument, a missing key; the exception is raised at the same
+    place for all the keys."""
+    return _get_info
@@ -0,0 +1,90 @@
+import sys
+import threading
+
+import pytest
+
+from friendly import async_output
+
+
+def make_writer(overflow):
+    """Returns a writer whose thread waits until release is set
+    before formatting the first exception, and the written output."""
+    release = threading.Event()
+    written = []
+
+    def formatter(info, include):
+        release.wait(5)
+        return f"{info['message']} ({include})\n"
+
+    writer = async_output.AsyncWriter(maxsize=2, overflow=overflow)
+    for n in range(5):
+        writer.submit({"message": str(n)}, formatter, "explain", written.append)
+        if n == 0:  # Wait for the writer to be blocked on the first one
+            while writer._queue.qsize():
+                pass
+    release.set()
+    assert writer.flush(timeout=5)
+    writer.stop(timeout=5)
+    return writer, written
+
+
+@pytest.mark.parametrize(
+    "overflow, expected",
+    [("drop_newest", ["0", "1", "2"]), ("drop_oldest", ["0", "3", "4"])],
+)
+def test_overflow_policy(overflow, expected, capsys):
+    writer, written = make_writer(overflow)
+    assert written == [f"{n} (explain)\n" for n in expected]
+    assert writer.dropped == 2
+    # Reported once, when flushed
+    assert capsys.readouterr().err.count("2 exception(s) was discarded") == 1
+
+
+def test_block_policy():
+    release = threading.Event()
+    written = []
+
+    def formatter(info, include):
+        release.wait(5)
+        return str(info["n"])
+
+    writer = async_output.AsyncWriter(maxsize=1, overflow="block")
+    submitter = threading.Thread(
+        target=lambda: [
+            writer.submit({"n": n}, formatter, "", written.append) for n in range(3)
+        ]
+    )
+    submitter.start()
+    submitter.join(0.2)
+    assert submitter.is_alive()  # Waiting for some room in the queue
+    release.set()
+    submitter.join(5)
+    assert writer.flush(timeout=5)
+    writer.stop(timeout=5)
+    assert written == ["0", "\n", "1", "\n", "2", "\n"]
+    assert writer.dropped == 0
+
+
+def test_exception_hook_does_not_format(monkeypatch):
+    from friendly_traceback.config import session
+
+    writer = async_output.AsyncWriter()
+    monkeypatch.setattr(async_output, "_writer", writer)
+    formatted = []
+    caller = threading.current_thread()
+
+    def formatter(info, include):
+        formatted.append(threading.current_thread() is not caller)
+        with pytest.raises(TypeError):
+            info["message"] = "changed"  # The copy is read-only
+        return ""
+
+    monkeypatch.setattr(session, "formatter", formatter)
+    monkeypatch.setattr(session, "write_err", lambda text: None)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        async_output.exception_hook(*sys.exc_info())
+    assert writer.flush(timeout=5)
+    writer.stop(timeout=5)
+    assert formatted == [True]
@@ -0,0 +1,26 @@
+import re
+
+from rich.segment import Segment
+from rich.style import Style
+
+from friendly import rich_formatters
+
+
+def test_css_classes_replace_inline_styles(monkeypatch):
+    monkeypatch.setattr(rich_formatters, "_css_classes", {})
+    monkeypatch.setattr(rich_formatters, "_new_css_rules", [])
+    red = Style(color="#ff0000", bold=True)
+    segments = [Segment("a < b", red), Segment(" "), Segment("c", red)]
+
+    html = rich_formatters._render_segments_html(segments, css_classes=True)
+    assert "style=\"color" not in html
+    classes = re.findall(r'class="(friendly-[0-9a-f]{8})"', html)
+    assert len(classes) == 2 and classes[0] == classes[1]
+    assert "a &lt; b" in html
+
+    stylesheet = rich_formatters._take_stylesheet()
+    assert stylesheet.count("{") == 1
+    assert f".{classes[0]} {{color: #ff0000;" in stylesheet
+    # The style sheet is only sent once.
+    rich_formatters._render_segments_html(segments, css_classes=True)
+    assert rich_formatters._take_stylesheet() == ""
@@ -0,0 +1,81 @@
+import friendly
+from friendly import dedup, rich_formatters
+from friendly_traceback.config import session
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_repeats_are_summarized_within_window(get_info):
+    clock = Clock()
+    formatter = dedup.Deduplicator(
+        rich_formatters.markdown, window=10, burst=10, clock=clock
+    )
+    first = get_info("b")
+    assert formatter(first, "why") == rich_formatters.markdown(first, "why")
+    assert formatter(first, "where") == rich_formatters.markdown(first, "where")
+
+    assert formatter(get_info("c")) == "KeyError: 'c' (seen 2 times)\n"
+    assert formatter(get_info("d")) == "KeyError: 'd' (seen 3 times)\n"
+    clock.now = 11
+    assert "seen" not in formatter(get_info("e"))
+
+
+def test_token_bucket(get_info):
+    clock = Clock()
+    formatter = dedup.Deduplicator(
+        rich_formatters.markdown, window=0, rate=0.5, burst=2, clock=clock
+    )
+    results = [formatter(get_info("b")) for _ in range(3)]
+    assert "skipped" not in results[0] and "skipped" not in results[1]
+    assert results[2] == "KeyError: 'b' (explanation skipped: too many exceptions)\n"
+    clock.now = 2  # One more token
+    assert "skipped" not in formatter(get_info("b"))
+    assert "skipped" in formatter(get_info("b"))
+
+
+def test_set_deduplication(monkeypatch, get_info):
+    from friendly import settings
+
+    monkeypatch.setattr(settings, "backend", settings.MemoryBackend())
+    original = session.formatter
+    try:
+        friendly.set_deduplication(window=30)
+        assert isinstance(session.formatter, dedup.Deduplicator)
+        assert session.formatter.window == 30
+        friendly.set_formatter("json")
+        assert session.formatter.formatter is rich_formatters.json_lines
+        session.formatter(get_info("b"))
+        assert '"count":2' in session.formatter(get_info("c"))
+        friendly.set_deduplication(False)
+        assert session.formatter is rich_formatters.json_lines
+    finally:
+        dedup._options = None
+        session.set_formatter(original)
+
+
+def test_copy_made_by_async_output_is_not_a_repeat(get_info):
+    import types
+
+    formatter = dedup.Deduplicator(rich_formatters.markdown, clock=Clock())
+    first = get_info("b")
+    copy = dict(first)
+    copy[dedup.INFO_ID] = id(first)
+    formatter(types.MappingProxyType(copy), "message")
+    assert formatter(first, "why") == rich_formatters.markdown(first, "why")
+    assert "seen 2 times" in formatter(get_info("c"))
+
+
+def test_summary_is_displayed_by_display_formatters(monkeypatch, get_info):
+    shown = []
+    monkeypatch.setattr(rich_formatters, "display_html", shown.append)
+    monkeypatch.setattr(rich_formatters, "ipython_available", True)
+    monkeypatch.setattr(rich_formatters, "interactive_html", lambda *args, **kw: "")
+    formatter = dedup.Deduplicator(rich_formatters.jupyter_interactive, clock=Clock())
+    formatter(get_info("b"), "friendly_tb")
+    assert formatter(get_info("c"), "friendly_tb") is None
+    assert shown[-1] == "<pre>KeyError: &#x27;c&#x27; (seen 2 times)</pre>"
@@ -0,0 +1,88 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from friendly import disk_cache, rich_formatters
+from friendly.theme import friendly_rich
+from friendly_traceback.config import session
+
+
+def test_least_recently_used_files_are_removed(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path), max_size=7000)
+    keys = [cache.key("text", n) for n in range(3)]
+    texts = [os.urandom(2000).hex() for _ in keys]  # about 2200 bytes compressed
+    for n, (key, text) in enumerate(zip(keys, texts)):
+        cache.put(key, text)
+        os.utime(cache._path(key), (n, n))
+    assert cache.get(keys[0]) == texts[0]  # now the most recently used
+
+    cache.put(cache.key("text", 3), os.urandom(2000).hex())
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == texts[0]
+    assert cache.get(keys[2]) == texts[2]
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_terminal_output_is_the_same(tmp_path, monkeypatch):
+    def write(text):
+        console = friendly_rich.new_console(
+            file=io.StringIO(),
+            force_terminal=True,
+            color_system="truecolor",
+            width=60,
+        )
+        monkeypatch.setattr(session, "console", console, raising=False)
+        rich_formatters.rich_writer(text)
+        return console.file.getvalue()
+
+    text = "Some `code` and\n\n```python\nx = {'a': 1}['b']\n```\n"
+    monkeypatch.setattr(disk_cache, "_cache", None)
+    expected = write(text)
+    cache = disk_cache.enable(str(tmp_path))
+    try:
+        assert write(text) == expected
+        assert len(os.listdir(tmp_path)) == 1
+        rich_formatters.render_cache.clear()
+        monkeypatch.setattr(rich_formatters, "_render_markdown", None)
+        assert write(text) == expected  # Read from the disk
+    finally:
+        disk_cache.disable()
+    assert cache.directory == str(tmp_path)
+
+
+def test_cache_is_disabled_if_the_directory_cannot_be_created(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = disk_cache.enable(str(blocker / "cache"))  # nothing is created
+    try:
+        assert cache.get(cache.key("text")) is None
+        with pytest.warns(RuntimeWarning):
+            cache.put(cache.key("text"), "text")
+        assert disk_cache.get_cache() is None
+    finally:
+        disk_cache.disable()
+
+
+def test_import_with_invalid_cache_directory(tmp_path):
+    env = dict(os.environ, FRIENDLY_CACHE_DIR=str(tmp_path / "file" / "cache"))
+    (tmp_path / "file").write_text("")
+    subprocess.run([sys.executable, "-c", "import friendly"], env=env, check=True)
+    assert not (tmp_path / "file" / "cache").exists()
+
+
+def test_directory_is_scanned_only_when_too_large(tmp_path, monkeypatch):
+    cache = disk_cache.DiskCache(str(tmp_path), max_size=7000)
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, "_scan", lambda: scans.append(1) or scan())
+    for n in range(3):
+        cache.put(cache.key("text", n), os.urandom(2000).hex())
+    assert len(scans) == 1  # initial size
+    cache.put(cache.key("text", 3), os.urandom(2000).hex())
+    assert len(scans) == 2
+    assert cache._size == sum(
+        os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)
+    )
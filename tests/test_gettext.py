@@ -0,0 +1,78 @@
+import threading
+import time
+
+from friendly import my_gettext
+
+
+def test_catalogs_are_loaded_lazily_and_cached(monkeypatch):
+    loaded = []
+    original_translation = my_gettext.gettext.translation
+
+    def counting_translation(domain, *args, **kwargs):
+        loaded.append(domain)
+        return original_translation(domain, *args, **kwargs)
+
+    monkeypatch.setattr(my_gettext.gettext, "translation", counting_translation)
+    lang = my_gettext.LangState()
+    lang.install("fr")
+    lang.install("en")
+    assert not loaded
+
+    text = "Friendly is loaded"
+    lang.translate(text)
+    lang.install("fr")
+    lang.translate(text)
+    assert set(loaded) == {"friendly_en", "friendly_fr"}
+    nb_loaded = len(loaded)
+    for code in ["en", "fr", "en"]:
+        lang.install(code)
+        lang.translate(text)
+    assert len(loaded) == nb_loaded
+    assert lang.lang == "en"
+
+
+def test_regional_language_falls_back_to_generic():
+    lang = my_gettext.LangState()
+    lang.install("fr_CA")
+    lang.translate("")
+    assert lang.lang == "fr"
+
+
+def test_cache_eviction(monkeypatch):
+    monkeypatch.setattr(my_gettext, "CACHE_SIZE", 2)
+    lang = my_gettext.LangState()
+    for code in ["fr", "es", "ru"]:
+        lang.install(code)
+        lang.translate("")
+    assert list(lang._catalogs) == ["es", "ru"]
+
+
+def test_lang_is_updated_by_install():
+    lang = my_gettext.LangState()
+    lang.install("fr")
+    assert lang.lang == "fr"
+
+
+def test_concurrent_activation(monkeypatch):
+    original_load = my_gettext.LangState._load_catalog
+
+    def slow_load(self, code):
+        time.sleep(0.01)  # Lets the other threads try to activate it
+        return original_load(self, code)
+
+    monkeypatch.setattr(my_gettext.LangState, "_load_catalog", slow_load)
+    lang = my_gettext.LangState()
+    lang.install("fr")
+    results = []
+
+    def translate():
+        results.append(lang.translate("The file {filename} does not exist."))
+
+    threads = [threading.Thread(target=translate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["Le fichier {filename} n'existe pas."] * len(threads)
+    assert list(lang._catalogs) == ["fr"]
+    assert lang.lang == "fr"
@@ -0,0 +1,63 @@
+import pytest
+
+from friendly_traceback.utils import get_highlighting_ranges
+from friendly.theme import friendly_pygments, friendly_rich
+
+CODE_BLOCKS = [
+    """
+       1| def f(items):
+       2|     '''Docstring
+       3|     on three
+       4|     lines''' + "x"
+    -->5|     return [int(x) for x in items if isinstance(x, str)]
+                      ^^^^^^
+       6|         # comment
+""",
+    """
+    -->8|     a = (1 +
+               ^^^^^
+       9|          2)
+      10|   else:
+      11|     b = $ 'unclosed
+""",
+    """
+      20|     s = '''unclosed
+    -->21|     string
+              ^^^^^^
+""",
+]
+
+
+def render(lines, tokenize_once=True):
+    highlighter = friendly_rich.ColourHighlighter(friendly_pygments.friendly_dark)
+    if not tokenize_once:
+        highlighter.index_tokens_by_line = lambda tokens: setattr(
+            highlighter, "tokens_by_line", {}
+        )
+    new_lines = highlighter.format_lines(lines, get_highlighting_ranges(lines))
+    return [(text.plain, text.spans) for text in new_lines]
+
+
+@pytest.mark.parametrize("block", CODE_BLOCKS)
+def test_tokenizing_once_is_same_as_tokenizing_each_line(block):
+    lines = block.strip("\n").split("\n")
+    assert render(lines) == render(lines, tokenize_once=False)
+
+
+def test_styles_are_cached_until_highlight_changes(monkeypatch):
+    from friendly import settings
+    from friendly.theme import colours
+
+    monkeypatch.setattr(settings, "backend", settings.MemoryBackend())
+    theme = friendly_pygments.friendly_dark
+    colours.set_highlight(bg="red", fg="white")
+    first = friendly_rich.ColourHighlighter(theme)
+    second = friendly_rich.ColourHighlighter(theme)
+    assert first.code_style is second.code_style
+    assert str(first.error_style) == "#ffffff on #ff0000"
+
+    colours.set_highlight(bg="blue", fg="white")
+    assert not friendly_rich._styles_cache
+    assert str(friendly_rich.ColourHighlighter(theme).error_style) == (
+        "#ffffff on #0000ff"
+    )
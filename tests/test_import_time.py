@@ -0,0 +1,77 @@
+"""Importing friendly must remain fast: Rich, Pygments and IPython are only
+imported when a formatter that requires them is used.
+
+The import time budget can be changed using the environment variable
+FRIENDLY_IMPORT_BUDGET_MS, for example on a slow CI machine.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+HEAVY_PACKAGES = {"rich", "pygments", "IPython", "friendly_styles"}
+
+# Cumulative import time of friendly, excluding friendly_traceback,
+# as reported by  python -X importtime -c "import friendly"
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("FRIENDLY_IMPORT_BUDGET_MS", 150))
+
+
+def run_python(*args):
+    env = dict(os.environ, FRIENDLY_SETTINGS="memory")
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+
+def cumulative_import_times(importtime_output):
+    """Returns the cumulative time, in microseconds, of the first import
+    of each module listed in the output of ``-X importtime``."""
+    times = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = line[len("import time:") :].split("|")
+        times.setdefault(name.strip(), int(cumulative))
+    return times
+
+
+def test_heavy_packages_not_imported():
+    code = (
+        "import sys, friendly\n"
+        "friendly.set_formatter('plain')\n"
+        "print(' '.join(sys.modules))"
+    )
+    modules = run_python("-c", code).stdout.split()
+    imported = {name.split(".")[0] for name in modules} & HEAVY_PACKAGES
+    assert not imported
+
+
+def test_json_formatter_does_not_import_heavy_packages():
+    code = (
+        "import sys, friendly, friendly_traceback\n"
+        "friendly.set_formatter('json')\n"
+        "output = []\n"
+        "try:\n"
+        "    1/0\n"
+        "except Exception:\n"
+        "    friendly_traceback.explain_traceback(redirect=output.append)\n"
+        "assert output[0].startswith('{')\n"
+        "print(' '.join(sys.modules))"
+    )
+    modules = run_python("-c", code).stdout.split()
+    imported = {name.split(".")[0] for name in modules} & HEAVY_PACKAGES
+    assert not imported
+
+
+def test_import_time_budget():
+    times = cumulative_import_times(
+        run_python("-X", "importtime", "-c", "import friendly").stderr
+    )
+    own_time = times["friendly"] - times.get("friendly_traceback", 0)
+    assert own_time / 1000 < IMPORT_TIME_BUDGET_MS
@@ -0,0 +1,29 @@
+import json
+
+import friendly
+from friendly import rich_formatters
+
+
+def test_json_lines(get_info):
+    info = get_info("b")
+    line = rich_formatters.json_lines(info, "why")
+    assert line.endswith("}\n") and line.count("\n") == 1
+    record = json.loads(line)
+    assert record["exception"] == "KeyError"
+    assert record["message"] == "KeyError: 'b'"
+    assert record["include"] == "why"
+    assert record["cause"] == info["cause"]
+    assert "generic" not in record
+    assert set(record["timings"]) == {"time", "format_ms"}
+
+    # Same error, same place, but a different key.
+    assert record["fingerprint"] == rich_formatters.fingerprint(get_info("c"))
+
+
+def test_render_json():
+    try:
+        1 / 0
+    except ZeroDivisionError as e:
+        record = json.loads(friendly.render(e, formatter="json", include="explain"))
+    assert record["exception"] == "ZeroDivisionError"
+    assert "shortened_traceback" in record
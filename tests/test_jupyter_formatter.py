@@ -0,0 +1,23 @@
+from friendly import rich_formatters
+
+
+def test_style_sheet_is_sent_once(monkeypatch, get_info):
+    shown = []
+    monkeypatch.setattr(rich_formatters, "display_html", shown.append)
+    monkeypatch.setattr(rich_formatters, "_jupyter_css_sent", False)
+    info = get_info()
+
+    rich_formatters.jupyter(info, "explain")
+    first = shown[:]
+    shown.clear()
+    rich_formatters.jupyter(info, "explain")
+    assert first[0].startswith("<style>")
+    assert first[1:] == shown
+
+
+def test_highlighted_html_is_cached():
+    rich_formatters.highlight_html.cache_clear()
+    first = rich_formatters.highlight_html("a = 1\n", "python")
+    assert 'class="highlight"' in first
+    assert rich_formatters.highlight_html("a = 1\n", "python") is first
+    assert rich_formatters.highlight_html.cache_info().hits == 1
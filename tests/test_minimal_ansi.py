@@ -0,0 +1,36 @@
+from rich.segment import Segment
+from rich.style import Style
+from rich.text import Text
+
+import friendly
+from friendly import rich_formatters
+
+
+def test_only_style_changes_are_written():
+    red = Style(color="#ff0000", bgcolor="#101010")
+    bold_red = Style(color="#ff0000", bgcolor="#101010", bold=True)
+    segments = [
+        Segment("a", red),
+        Segment("b", red),
+        Segment(" ", Style(color="#00ff00", bgcolor="#101010")),
+        Segment("c", bold_red),
+        Segment("\n"),
+        Segment("d"),
+    ]
+    ansi = rich_formatters.minimal_ansi(segments, "truecolor", "#101010")
+    assert ansi == "\x1b[38;2;255;0;0mab \x1b[1mc\x1b[0m\nd"
+
+    ansi = rich_formatters.minimal_ansi(segments, "truecolor", "#000000")
+    assert ansi.count("48;2;16;16;16") == 1
+
+
+def test_minimal_ansi_shows_the_same_text():
+    try:
+        {"a": 1}["b"]
+    except KeyError as e:
+        exc = e
+    ansi = friendly.render(exc, include="explain")
+    minimal = friendly.render(exc, include="explain", output="minimal_ansi")
+    assert len(minimal) < len(ansi)
+    text = friendly.render(exc, include="explain", output="text")
+    assert Text.from_ansi(minimal).plain == text
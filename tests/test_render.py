@@ -0,0 +1,97 @@
+import threading
+
+import rich
+from rich import jupyter as rich_jupyter
+from rich.markdown import CodeBlock, Heading
+
+import friendly
+from friendly_traceback.config import session
+
+
+def get_exception():
+    try:
+        a = {"x": 1}
+        a["y"]
+    except KeyError as e:
+        return e
+
+
+def test_render_does_not_change_global_state():
+    console = getattr(session, "console", None)
+    rich_console = rich.get_console()
+    html_format = rich_jupyter.JUPYTER_HTML_FORMAT
+    exc = get_exception()
+
+    ansi = friendly.render(exc, include="explain", width=60)
+    assert "\x1b[" in ansi
+    text = friendly.render(exc, formatter="light", output="text")
+    assert "\x1b[" not in text and "KeyError" in text
+    html = friendly.render(exc, output="html")
+    assert "KeyError" in html and "<span" in html
+    assert "KeyError" in friendly.render(exc, formatter="plain")
+
+    assert getattr(session, "console", None) is console
+    assert rich.get_console() is rich_console
+    assert rich_jupyter.JUPYTER_HTML_FORMAT == html_format
+
+
+def test_render_does_not_change_rich_markdown(monkeypatch):
+    def rich_console(self, console, options):
+        yield from ()
+
+    monkeypatch.setattr(Heading, "__rich_console__", rich_console)
+    monkeypatch.setattr(CodeBlock, "__rich_console__", rich_console)
+    friendly.render_sections(get_exception(), formatter="light")
+    assert Heading.__rich_console__ is rich_console
+    assert CodeBlock.__rich_console__ is rich_console
+
+
+def test_render_from_threads():
+    exc = get_exception()
+    expected = friendly.render(exc, include="where")
+    results = []
+
+    def worker():
+        for _ in range(5):
+            results.append(friendly.render(exc, include="where"))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [expected] * 20
+
+
+def get_nested_exception():
+    def inner(d):
+        return d["y"]
+
+    try:
+        inner({"x": 1})
+    except KeyError as e:
+        return e
+
+
+def test_render_sections_is_same_as_render(monkeypatch):
+    from friendly import rich_formatters
+    from friendly.theme import friendly_rich
+
+    exc = get_nested_exception()
+    rich_formatters.render_cache.clear()
+    rendered = []
+    original = friendly_rich._code_block_renderables
+
+    def counting_renderables(code, *args):
+        rendered.append(code)
+        return original(code, *args)
+
+    monkeypatch.setattr(friendly_rich, "_code_block_renderables", counting_renderables)
+    sections = friendly.render_sections(exc)
+    assert list(sections) == rich_formatters.SECTIONS
+    # Code shown in more than one section is only highlighted once.
+    assert len(rendered) == len(set(rendered))
+
+    rich_formatters.render_cache.clear()
+    for section, result in sections.items():
+        assert result == friendly.render(exc, include=section)
@@ -0,0 +1,45 @@
+import io
+
+from rich.console import Console
+
+from friendly import rich_formatters
+
+TEXT = "# Header\n\n```python\n    -->1| print(x)\n                ^\n```"
+
+
+def test_cached_segments_are_reused(monkeypatch):
+    console = Console(file=io.StringIO(), width=60, color_system="truecolor")
+    cache = rich_formatters.RenderCache()
+    rendered = []
+    original_render = rich_formatters._render_markdown
+
+    def counting_render(*args, **kwargs):
+        rendered.append(args[0])
+        return original_render(*args, **kwargs)
+
+    monkeypatch.setattr(rich_formatters, "_render_markdown", counting_render)
+    first = cache.get_segments(TEXT, console)
+    assert cache.get_segments(TEXT, console) is first
+    assert len(rendered) == 1
+
+    console.width = 40
+    cache.get_segments(TEXT, console)
+    assert len(rendered) == 2
+
+
+def test_cache_size_is_bounded():
+    console = Console(file=io.StringIO(), width=60)
+    cache = rich_formatters.RenderCache(max_size=5000)
+    for n in range(20):
+        cache.get_segments(f"Message {n}", console)
+        assert cache.size <= 5000
+    assert 0 < len(cache._entries) < 20
+
+
+def test_cache_size_includes_segment_overhead():
+    console = Console(file=io.StringIO(), width=60)
+    cache = rich_formatters.RenderCache()
+    segments = cache.get_segments(TEXT, console)
+    characters = len(TEXT) + sum(len(segment.text) for segment in segments)
+    overhead = len(segments) * rich_formatters.RenderCache.SEGMENT_OVERHEAD
+    assert cache.size == characters + overhead
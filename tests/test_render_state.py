@@ -0,0 +1,107 @@
+import threading
+import time
+
+from friendly_traceback.config import session
+
+from friendly import rich_formatters
+
+
+def test_render_state_is_not_shared_by_threads(monkeypatch, get_info):
+    monkeypatch.setattr(session, "is_jupyter", True)
+    monkeypatch.setattr(session, "rich_width", 60)
+    monkeypatch.setattr(session, "rich_tb_width", 100)
+    info = get_info()
+    expected = {
+        "explain": rich_formatters.RenderState(header=True, width=100),
+        "where": rich_formatters.RenderState(header=False, width=100),
+        "what": rich_formatters.RenderState(header=False, width=None),
+    }
+    barrier = threading.Barrier(len(expected) * 2)
+    errors = []
+    ids = []
+
+    def worker(include):
+        barrier.wait()
+        for _ in range(100):
+            rich_formatters._rich_markdown(info, include)
+            ids.append(next(rich_formatters._html_ids))
+            time.sleep(0)  # Let other threads run, as writing the output would
+            state = rich_formatters._take_render_state()
+            if state != expected[include]:
+                errors.append((include, state))
+
+    threads = [
+        threading.Thread(target=worker, args=(include,))
+        for include in list(expected) * 2
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(set(ids)) == len(ids) == 600
+    assert rich_formatters._take_render_state() == rich_formatters.RenderState()
+
+
+class ThreadFiles:
+    """File writing to a separate buffer for each thread."""
+
+    def __init__(self):
+        self.buffers = {}
+
+    def write(self, text):
+        self.buffers.setdefault(threading.get_ident(), []).append(text)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        return "".join(self.buffers.pop(threading.get_ident(), []))
+
+
+def test_concurrent_renders_use_their_own_width_and_header(monkeypatch, get_info):
+    from friendly.theme import friendly_rich
+
+    files = ThreadFiles()
+    console = friendly_rich.new_console(file=files, width=60, color_system=None)
+    monkeypatch.setattr(session, "console", console, raising=False)
+    monkeypatch.setattr(session, "rich_add_vspace", False, raising=False)
+    monkeypatch.setattr(session, "is_jupyter", True)
+    monkeypatch.setattr(session, "rich_width", 60)
+    monkeypatch.setattr(session, "rich_tb_width", 100)
+    info = get_info()
+
+    def render(include):
+        text = rich_formatters.rich_markdown(info, include)
+        time.sleep(0)  # Let other threads run, as friendly_traceback would
+        rich_formatters.rich_writer(text)
+        return files.take()
+
+    expected = {include: render(include) for include in ["explain", "where", "what"]}
+    widths = {
+        include: max(len(line) for line in output.splitlines())
+        for include, output in expected.items()
+    }
+    assert widths["explain"] == 100 and "Traceback" in expected["explain"]
+    assert widths["what"] <= 60 and "╭" not in expected["what"]
+
+    barrier = threading.Barrier(len(expected) * 2)
+    errors = []
+
+    def worker(include):
+        barrier.wait()
+        for _ in range(20):
+            rich_formatters.render_cache.clear()
+            output = render(include)
+            if output != expected[include]:
+                errors.append((include, output))
+
+    threads = [
+        threading.Thread(target=worker, args=(include,))
+        for include in list(expected) * 2
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
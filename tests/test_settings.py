@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from friendly import settings
+
+
+@pytest.fixture
+def settings_file(tmp_path, monkeypatch):
+    filename = str(tmp_path / "friendly.ini")
+    with open(filename, "w") as f:
+        f.write("")
+    monkeypatch.setattr(settings, "backend", settings.FileBackend(filename))
+    monkeypatch.setattr(settings, "ENVIRONMENT", "test-env")
+    yield filename
+
+
+def test_read_after_write(settings_file):
+    assert settings.read(option="formatter") is None
+    settings.write(option="formatter", value="dark")
+    assert settings.read(option="formatter") == "dark"
+    assert settings.has_environment("test-env")
+    settings._remove_environment()
+    assert not settings.has_environment("test-env")
+
+
+def test_file_is_parsed_only_when_changed(settings_file, monkeypatch):
+    settings.write(option="formatter", value="dark")
+    parsed = []
+    original_read = settings.configparser.ConfigParser.read
+
+    def counting_read(self, *args, **kwargs):
+        parsed.append(args)
+        return original_read(self, *args, **kwargs)
+
+    monkeypatch.setattr(settings.configparser.ConfigParser, "read", counting_read)
+    for _ in range(10):
+        assert settings.read(option="formatter") == "dark"
+    assert not parsed
+
+    # Simulate another process updating the file.
+    with open(settings_file, "w") as f:
+        f.write("[test-env]\nformatter = light\n")
+    stat = os.stat(settings_file)
+    os.utime(settings_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert settings.read(option="formatter") == "light"
+    assert len(parsed) == 1
+
+
+def test_transaction_writes_file_once(settings_file, monkeypatch):
+    saved = []
+    original_save = settings.backend._save
+    monkeypatch.setattr(
+        settings.backend, "_save", lambda config: saved.append(original_save(config))
+    )
+    with settings.transaction():
+        settings.write(option="formatter", value="dark")
+        settings.write(option="background", value="#101010")
+        with settings.transaction():
+            settings.write(option="color_system", value="truecolor")
+        assert not saved
+        assert settings.read(option="color_system") == "truecolor"
+    assert len(saved) == 1
+    settings.clear_cache()
+    assert settings.read(option="formatter") == "dark"
+    assert settings.read(option="background") == "#101010"
+
+    # Writing an unchanged value does not touch the file.
+    settings.write(option="formatter", value="dark")
+    assert len(saved) == 1
+    temp_files = [
+        name
+        for name in os.listdir(os.path.dirname(settings_file))
+        if name.startswith(".friendly-")
+    ]
+    assert not temp_files
+
+
+def test_memory_backend(monkeypatch):
+    monkeypatch.setattr(settings, "backend", settings.MemoryBackend())
+    monkeypatch.setattr(settings, "ENVIRONMENT", "test-env")
+    assert not settings.has_environment()
+    with settings.transaction():
+        settings.write(option="formatter", value="light")
+    assert settings.read(option="formatter") == "light"
+    assert settings.has_environment()
+
+
+def test_environment_backend(monkeypatch):
+    environ = {"FRIENDLY_SETTING_FORMATTER": "dark", "FRIENDLY_SETTING_LANG": "fr"}
+    monkeypatch.setattr(settings, "backend", settings.EnvironmentBackend(environ))
+    monkeypatch.setattr(settings, "ENVIRONMENT", "test-env")
+    assert settings.has_environment()
+    assert settings.read(option="formatter") == "dark"
+    assert settings.get_lang() == "fr"
+    settings.write(option="formatter", value="light")
+    assert settings.read(option="formatter") == "light"
+    assert settings.read(option="formatter", environment="common") == "dark"
+
+
+def test_environment_backend_section_can_be_removed(monkeypatch):
+    environ = {"FRIENDLY_SETTING_FORMATTER": "dark"}
+    monkeypatch.setattr(settings, "backend", settings.EnvironmentBackend(environ))
+    monkeypatch.setattr(settings, "ENVIRONMENT", "test-env")
+    assert settings.has_environment()
+    settings._remove_environment()
+    assert not settings.has_environment()
+
+
+def test_file_mode_is_preserved(settings_file):
+    os.chmod(settings_file, 0o644)
+    settings.write(option="formatter", value="dark")
+    assert os.stat(settings_file).st_mode & 0o777 == 0o644
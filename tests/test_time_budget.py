@@ -0,0 +1,37 @@
+import io
+
+from friendly import rich_formatters, time_budget
+from friendly.theme import friendly_rich
+from friendly_traceback.config import session
+
+
+def test_python_traceback_is_shown_when_budget_is_exceeded(get_info):
+    info = get_info()
+    formatter = time_budget.TimeBudget(rich_formatters.rich_markdown, 10)
+    assert formatter(info, "explain") == rich_formatters.rich_markdown(
+        info, "explain"
+    )
+
+    formatter = time_budget.TimeBudget(rich_formatters.rich_markdown, -1)
+    text = formatter(info, "explain")
+    assert text.startswith(info["simulated_python_traceback"].rstrip())
+    assert "formatting took too long" in text
+    assert rich_formatters._take_render_state().plain
+    assert time_budget.get_degraded()[-1]["stage"] == "markdown"
+
+
+def test_rendering_is_abandoned(monkeypatch, get_info):
+    console = friendly_rich.new_console(file=io.StringIO(), width=60)
+    monkeypatch.setattr(session, "console", console, raising=False)
+    monkeypatch.setattr(session, "rich_add_vspace", False, raising=False)
+    info = get_info()
+    formatter = time_budget.TimeBudget(rich_formatters.rich_markdown, 10)
+    text = formatter(info, "explain") + "\n\n```python\n" + "x = 1\n" * 500 + "```\n"
+    rich_formatters._render_state.get().budget.deadline = 0
+    rich_formatters.rich_writer(text)
+    assert time_budget.get_degraded()[-1]["stage"] == "render"
+    output = console.file.getvalue()
+    assert output.startswith(info["simulated_python_traceback"].rstrip())
+    assert "x = 1" not in output
+    assert time_budget._current.get() is None
+    time_budget.check("render")  # The budget no longer applies